@@ -0,0 +1,75 @@
+import numpy as np
+
+# Vectorized bucket aggregation over column arrays, an alternative to doing
+# the GROUP BY in SQL. Produces the same rows as a store's bucket_aggregate:
+#   (bucket_start, host, temp_sum, temp_count, temp_min, temp_max,
+#    hum_sum, hum_count, hum_min, hum_max), newest bucket first
+
+
+def columns_from_rows(rows, hosts=None):
+    # range_query rows -> (ts, host_idx, temp, hum, hosts) with NaN for NULLs
+    if hosts is None:
+        hosts = sorted({r[0] for r in rows})
+    index = {h: i for i, h in enumerate(hosts)}
+    rows = [r for r in rows if r[0] in index]
+    ts = np.fromiter((r[5] for r in rows), dtype=np.float64, count=len(rows))
+    host_idx = np.fromiter((index[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+    temp = np.array([np.nan if r[3] is None else r[3] for r in rows], dtype=np.float64)
+    hum = np.array([np.nan if r[4] is None else r[4] for r in rows], dtype=np.float64)
+    return ts, host_idx, temp, hum, list(hosts)
+
+
+def range_columns(store, start, end, hosts=None):
+    # Use the store's own columnar read when it has one
+    if hasattr(store, "range_columns"):
+        return store.range_columns(start, end, hosts)
+    return columns_from_rows(store.range_query(start, end, hosts), hosts)
+
+
+def aggregate(ts, host_idx, temp, hum, hosts, bucket_seconds):
+    if not len(ts):
+        return []
+    bucket_idx = np.floor_divide(ts, bucket_seconds).astype(np.int64)
+    # One group per (bucket, host); after sorting by that key each group is a
+    # contiguous run, so reduceat can use the run boundaries
+    key = bucket_idx * len(hosts) + host_idx
+    order = np.argsort(key, kind="stable")
+    groups, first, inverse = np.unique(key[order], return_index=True, return_inverse=True)
+    n = len(groups)
+    stats = []
+    for values in (temp, hum):
+        have = ~np.isnan(values)
+        sums = np.bincount(inverse, weights=np.where(have, values, 0.0)[order], minlength=n)
+        counts = np.bincount(inverse, weights=have[order], minlength=n).astype(np.int64)
+        sorted_values = values[order]
+        stats.append((
+            sums,
+            counts,
+            np.fmin.reduceat(sorted_values, first),
+            np.fmax.reduceat(sorted_values, first),
+        ))
+    starts = (groups // len(hosts)) * bucket_seconds
+    host_of = groups % len(hosts)
+    rows = []
+    for g in range(n):
+        agg = []
+        for sums, counts, lo, hi in stats:
+            c = int(counts[g])
+            agg += [float(sums[g]), c, float(lo[g]) if c else None, float(hi[g]) if c else None]
+        rows.append((float(starts[g]), hosts[host_of[g]], *agg))
+    rows.sort(key=lambda r: (r[0], r[1]), reverse=True)
+    return rows
+
+
+class NumpyEngine:
+    # Wraps a store so bucket_aggregate is computed here instead of in SQL;
+    # everything else is passed through
+    def __init__(self, store):
+        self.store = store
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def bucket_aggregate(self, bucket_seconds, start, end, hosts=None):
+        ts, host_idx, temp, hum, hosts = range_columns(self.store, start, end, hosts)
+        return aggregate(ts, host_idx, temp, hum, hosts, bucket_seconds)
@@ -0,0 +1,223 @@
+import os
+import sys
+import struct
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+
+import dhtAggregate
+import dhtStorage
+
+# Columnar cold archive: one file per host per UTC day,
+#   <dir>/<host>/<YYYY-MM-DD>.dhtc
+#
+# Layout (little endian):
+#   header   32 bytes, see HEADER
+#   ts       uint32[n]  delta from the previous reading (the first from the
+#                       day start), in seconds
+#   temp     int16[n]   fixed point, value * scale, MISSING if NULL
+#   hum      int16[n]   fixed point, value * scale, MISSING if NULL
+#
+# The arrays are read straight out of an mmap, so aggregates never build
+# Python rows.
+MAGIC = b"DHTC"
+VERSION = 1
+SCALE = 100
+MISSING = -32768
+HEADER = struct.Struct("<4sHHqI12x")  # magic, version, scale, day start, n
+DAY = 86400
+
+
+def day_start(epoch):
+    return int(epoch // DAY * DAY)
+
+
+def day_name(start):
+    return datetime.fromtimestamp(start, timezone.utc).strftime("%Y-%m-%d")
+
+
+def archive_path(directory, host, start):
+    return os.path.join(directory, host, day_name(start) + ".dhtc")
+
+
+def to_fixed(values):
+    # Clamped to +-32767 like dhtBucket.bin_fixed, so a bad reading can't
+    # overflow int16 or turn into MISSING; NaN is missing
+    out = np.full(len(values), MISSING, dtype=np.int16)
+    for i, v in enumerate(values):
+        if v is not None and v == v:
+            out[i] = round(max(-32767, min(32767, v * SCALE)))
+    return out
+
+
+def write_day(directory, host, start, rows):
+    # rows: range_query rows for one host within [start, start + DAY), oldest first
+    ts = np.array([r[5] for r in rows], dtype=np.int64)
+    deltas = np.diff(ts, prepend=start).astype(np.uint32)
+    path = archive_path(directory, host, start)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, SCALE, start, len(rows)))
+        f.write(deltas.tobytes())
+        f.write(to_fixed([r[3] for r in rows]).tobytes())
+        f.write(to_fixed([r[4] for r in rows]).tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+def read_day(path):
+    # (ts int64[n], temp int16[n], hum int16[n], scale); temp/hum are mmap views
+    raw = np.memmap(path, dtype=np.uint8, mode="r")
+    magic, version, scale, start, n = HEADER.unpack_from(raw, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not a v{VERSION} dhtc file")
+    off = HEADER.size
+    deltas = np.frombuffer(raw, dtype="<u4", count=n, offset=off)
+    off += 4 * n
+    temp = np.frombuffer(raw, dtype="<i2", count=n, offset=off)
+    off += 2 * n
+    hum = np.frombuffer(raw, dtype="<i2", count=n, offset=off)
+    ts = start + np.cumsum(deltas, dtype=np.int64)
+    return ts, temp, hum, scale
+
+
+class ArchiveStore:
+    # Read-only store over the columnar archive; the exporter below writes it
+    def __init__(self, directory):
+        self.directory = directory
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def append_batch(self, rows):
+        raise TypeError("the archive is read-only; it is written by `dhtArchive.py export`")
+
+    def hosts(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.listdir(self.directory))
+
+    def newest_day(self):
+        # Start of the newest day exported for any host, or None if empty
+        names = [
+            name
+            for host in self.hosts()
+            for name in os.listdir(os.path.join(self.directory, host))
+            if name.endswith(".dhtc")
+        ]
+        if not names:
+            return None
+        return int(parse_day(max(names)[:-len(".dhtc")]))
+
+    def columns(self, host, start, end):
+        # Concatenated (ts, temp, hum) arrays for one host, start <= ts < end,
+        # with temp/hum as float64 and NaN for missing
+        parts = []
+        day = day_start(start)
+        while day < end:
+            path = archive_path(self.directory, host, day)
+            if os.path.exists(path):
+                ts, temp, hum, scale = read_day(path)
+                keep = (ts >= start) & (ts < end)
+                parts.append((ts[keep], temp[keep], hum[keep], scale))
+            day += DAY
+        if not parts:
+            empty = np.empty(0)
+            return empty.astype(np.int64), empty, empty
+        ts = np.concatenate([p[0] for p in parts])
+        temp = np.concatenate([fixed_to_float(p[1], p[3]) for p in parts])
+        hum = np.concatenate([fixed_to_float(p[2], p[3]) for p in parts])
+        return ts, temp, hum
+
+    def range_query(self, start, end, hosts=None):
+        rows = []
+        for host in hosts if hosts is not None else self.hosts():
+            ts, temp, hum = self.columns(host, start, end)
+            for t, a, b in zip(ts.tolist(), temp.tolist(), hum.tolist()):
+                rows.append((host, None, None, none_if_nan(a), none_if_nan(b), float(t)))
+        rows.sort(key=lambda r: r[5])
+        return rows
+
+    def range_columns(self, start, end, hosts=None):
+        # All hosts' columns in the dhtAggregate layout
+        hosts = list(hosts) if hosts is not None else self.hosts()
+        parts = [self.columns(host, start, end) for host in hosts]
+        host_idx = [np.full(len(p[0]), i, dtype=np.int64) for i, p in enumerate(parts)]
+        if not parts:
+            return np.empty(0), np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), hosts
+        return (
+            np.concatenate([p[0] for p in parts]),
+            np.concatenate(host_idx),
+            np.concatenate([p[1] for p in parts]),
+            np.concatenate([p[2] for p in parts]),
+            hosts,
+        )
+
+    def bucket_aggregate(self, bucket_seconds, start, end, hosts=None):
+        ts, host_idx, temp, hum, hosts = self.range_columns(start, end, hosts)
+        return dhtAggregate.aggregate(ts, host_idx, temp, hum, hosts, bucket_seconds)
+
+
+def fixed_to_float(values, scale):
+    out = values.astype(np.float64) / scale
+    out[values == MISSING] = np.nan
+    return out
+
+
+def none_if_nan(v):
+    return None if v != v else v
+
+
+def export(source, directory, hosts, since, before, overwrite=False):
+    # Write one file per host per day for days in [since, before)
+    day = day_start(since)
+    written = 0
+    while day < before:
+        for host in hosts:
+            path = archive_path(directory, host, day)
+            if os.path.exists(path) and not overwrite:
+                continue
+            rows = source.range_query(day, day + DAY, [host])
+            if rows:
+                write_day(directory, host, day, rows)
+                written += 1
+        day += DAY
+    return written
+
+
+def parse_day(text):
+    return datetime.strptime(text, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the dht table to the columnar archive")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--out", required=True, help="archive directory")
+    parser.add_argument("--hosts", default=os.environ.get("DHT_HOSTS", "10.0.0.31,10.0.0.32"))
+    parser.add_argument("--since", required=True, help="first day to export, YYYY-MM-DD")
+    parser.add_argument("--before", help="export days before this one (default: today)")
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.before:
+        before = parse_day(args.before)
+    else:
+        before = day_start(datetime.now(timezone.utc).timestamp())
+    # Source is configured like the logger (DHT_BACKEND, DHT_DB, ...)
+    source = dhtStorage.store_from_config(os.environ.get)
+    source.open()
+    try:
+        n = export(source, args.out, args.hosts.split(","), parse_day(args.since), before, args.overwrite)
+    finally:
+        source.close()
+    print(f"wrote {n} day files to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
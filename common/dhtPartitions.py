@@ -0,0 +1,118 @@
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+
+# Monthly partitions are separate SQLite files, dht-YYYY-MM.db, each holding
+# a `dht` table with the same schema as the single-file store. Whole months
+# can then be dropped or archived with one unlink/rename.
+PARTITION_RE = re.compile(r"^dht-(\d{4}-\d{2})\.db$")
+
+CREATE_TABLE_SQL = "create table if not exists dht (id integer primary key, host text, sensor integer, client_id text, temp real, hum real, ts timestamp default current_timestamp)"
+# Covers host/time range reads without touching the table rows
+CREATE_INDEX_SQL = "create index if not exists dht_host_ts on dht (host, ts, temp, hum)"
+
+RANGE_COLUMNS = "host, sensor, client_id, temp, hum, ts"
+# What SqliteStore.range_columns reads: epoch seconds, temp, hum; all in the
+# index, so the table rows are not touched
+EPOCH_COLUMNS = "cast(strftime('%s', ts) as integer) as epoch, temp, hum"
+# SQLite attaches at most 10 databases to a connection (SQLITE_MAX_ATTACHED),
+# so range_query reads at most 11 partitions per connection
+MAX_ATTACHED = 10
+
+
+def open_db(path, journal_mode="wal", synchronous="normal"):
+    con = sqlite3.connect(path)
+    con.execute(f"pragma journal_mode={journal_mode}")
+    con.execute(f"pragma synchronous={synchronous}")
+    with con:
+        con.execute(CREATE_TABLE_SQL)
+        con.execute(CREATE_INDEX_SQL)
+    return con
+
+
+def month_of(ts):
+    # ts is 'YYYY-MM-DD HH:MM:SS' (UTC), as stored in the ts column
+    return ts[:7]
+
+
+def current_month(now=None):
+    now = now or datetime.now(timezone.utc)
+    return now.strftime("%Y-%m")
+
+
+def add_months(month, n):
+    y, m = int(month[:4]), int(month[5:7]) - 1 + n
+    return f"{y + m // 12:04d}-{m % 12 + 1:02d}"
+
+
+def partition_path(directory, month):
+    return os.path.join(directory, f"dht-{month}.db")
+
+
+def list_partitions(directory):
+    months = []
+    for name in os.listdir(directory):
+        m = PARTITION_RE.match(name)
+        if m:
+            months.append(m.group(1))
+    return sorted(months)
+
+
+def partitions_for(directory, start, end):
+    # Existing months overlapping [start, end)
+    first, last = month_of(start), month_of(end)
+    return [m for m in list_partitions(directory) if first <= m <= last]
+
+
+def range_query(directory, start, end, host=None, columns=RANGE_COLUMNS, order="ts"):
+    # Rows with start <= ts < end; only the partitions for those months are
+    # opened (attached), so a last-day query reads just the current file.
+    # Months do not overlap, so the per-connection results concatenate in ts
+    # order. `order` names the result column holding the time.
+    months = partitions_for(directory, start, end)
+    rows = []
+    for i in range(0, len(months), MAX_ATTACHED + 1):
+        rows += _query_months(directory, months[i:i + MAX_ATTACHED + 1], start, end, host, columns, order)
+    return rows
+
+
+def _query_months(directory, months, start, end, host, columns, order):
+    con = sqlite3.connect(f"file:{partition_path(directory, months[0])}?mode=ro", uri=True)
+    try:
+        selects = []
+        for i, month in enumerate(months):
+            schema = "main"
+            if i:
+                schema = f"p{i}"
+                con.execute("attach database ? as " + schema, (partition_path(directory, month),))
+            where = "ts >= ? and ts < ?" + (" and host = ?" if host else "")
+            selects.append(f"select {columns} from {schema}.dht where {where}")
+        params = []
+        for _ in months:
+            params += [start, end] + ([host] if host else [])
+        sql = " union all ".join(selects) + f" order by {order}"
+        return con.execute(sql, params).fetchall()
+    finally:
+        con.close()
+
+
+def apply_retention(directory, keep_months, archive_dir=None, now=None):
+    # Drop (or move to archive_dir) every partition older than keep_months,
+    # counting the current month. Only whole files are touched.
+    if keep_months <= 0:
+        return []
+    oldest = add_months(current_month(now), -(keep_months - 1))
+    expired = [m for m in list_partitions(directory) if m < oldest]
+    for month in expired:
+        path = partition_path(directory, month)
+        for suffix in ("", "-wal", "-shm"):
+            if not os.path.exists(path + suffix):
+                continue
+            if archive_dir:
+                os.makedirs(archive_dir, exist_ok=True)
+                os.replace(path + suffix, os.path.join(archive_dir, os.path.basename(path) + suffix))
+            else:
+                os.remove(path + suffix)
+        print("Retention:", "archived" if archive_dir else "dropped", month)
+    return expired
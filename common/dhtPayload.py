@@ -0,0 +1,67 @@
+import json
+import time
+import struct
+
+# Measurement payloads on dht_sensor_measurement. One reading:
+#   {"host": ..., "client_id": ..., "sensor": 14, "temp": 21.5, "hum": 40.1}
+# optionally with "ts" (epoch seconds, when it was measured), or readings a
+# node buffered and sent together, oldest first:
+#   {"host": ..., "client_id": ..., "sensor": 14,
+#    "batch": [{"ts": ..., "temp": ..., "hum": ...}, ...]}
+
+# The same readings packed by the node (esp/payload.py) on their own topic:
+#   header BIN_HEADER: magic, version, sensor, client id (6 bytes, the MAC),
+#   IPv4 address, count; then count BIN_RECORD: ts (0 if the node's clock is
+#   not set), temp and hum * 10
+BIN_TOPIC = "dht_sensor_measurement_bin"
+BIN_MAGIC = b"DHTM"
+BIN_VERSION = 1
+BIN_HEADER = "<4sBB6s4sB"
+BIN_RECORD = "<Ihh"
+
+# Reading timestamps further than this from the receive time are not
+# trusted (e.g. a node whose clock never synced) and replaced by it
+MAX_AGE = 7 * 86400
+MAX_AHEAD = 300
+
+
+def readings(d, now=None):
+    # One flat dict per reading, oldest first, each with a usable "ts";
+    # ValueError for a payload that is not an object
+    if not isinstance(d, dict):
+        raise ValueError("measurement payload must be an object")
+    if now is None:
+        now = time.time()
+    base = {k: v for k, v in d.items() if k != "batch"}
+    out = []
+    for item in d.get("batch") or [{}]:
+        r = dict(base, **item)
+        ts = r.get("ts")
+        if not isinstance(ts, (int, float)) or not now - MAX_AGE <= ts <= now + MAX_AHEAD:
+            r["ts"] = now
+        out.append(r)
+    return out
+
+
+def unpack(payload):
+    # BIN_TOPIC payload as the dict its JSON equivalent would parse to
+    head = struct.calcsize(BIN_HEADER)
+    if len(payload) < head or payload[:4] != BIN_MAGIC:
+        raise ValueError("not a measurement payload")
+    magic, version, sensor, client_id, ip, count = struct.unpack_from(BIN_HEADER, payload)
+    if version != BIN_VERSION or len(payload) != head + count * struct.calcsize(BIN_RECORD):
+        raise ValueError("bad measurement payload")
+    batch = []
+    for ts, temp, hum in struct.iter_unpack(BIN_RECORD, payload[head:]):
+        item = {"temp": temp / 10, "hum": hum / 10}
+        if ts:
+            item["ts"] = ts
+        batch.append(item)
+    return {"host": ".".join(map(str, ip)), "client_id": client_id.hex(), "sensor": sensor, "batch": batch}
+
+
+def decode(topic, payload):
+    # Parsed measurement payload from either topic
+    if topic == BIN_TOPIC:
+        return unpack(payload)
+    return json.loads(payload)
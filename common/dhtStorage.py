@@ -0,0 +1,521 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+import dhtPartitions
+
+# Storage backends shared by the measure logger and the web server.
+#
+# Every backend speaks the same three operations, with timestamps as epoch
+# seconds (UTC) everywhere:
+#
+#   append_batch(rows)    rows of (host, sensor, client_id, temp, hum, ts);
+#                         returns the rows it did not write, for the caller
+#                         to retry ([] when all are stored), and raises if it
+#                         wrote none
+#   range_query(start, end, hosts=None)
+#                         raw rows with start <= ts < end, oldest first, in
+#                         the same shape as append_batch takes
+#   bucket_aggregate(bucket_seconds, start, end, hosts=None)
+#                         one row per (bucket, host), newest bucket first:
+#                         (bucket_start, host, temp_sum, temp_count, temp_min,
+#                          temp_max, hum_sum, hum_count, hum_min, hum_max)
+#
+# plus open()/close() around their lifetime.
+
+# Per-host aggregate layout, also used for the MQTT running aggregates
+TEMP_SUM, TEMP_COUNT, TEMP_MIN, TEMP_MAX, HUM_SUM, HUM_COUNT, HUM_MIN, HUM_MAX = range(8)
+
+# Per-host Postgres rollups of iso.dht, finest first: (bucket seconds, table)
+ROLLUPS = [
+    (60, "iso.dht_rollup_1m"),
+    (3600, "iso.dht_rollup_1h"),
+    (86400, "iso.dht_rollup_1d"),
+]
+
+
+def new_agg():
+    return [0.0, 0, None, None, 0.0, 0, None, None]
+
+
+def add_value(agg, i, v):
+    # i is the *_SUM index; count/min/max follow it
+    if v is None:
+        return
+    agg[i] += v
+    agg[i + 1] += 1
+    if agg[i + 2] is None or v < agg[i + 2]:
+        agg[i + 2] = v
+    if agg[i + 3] is None or v > agg[i + 3]:
+        agg[i + 3] = v
+
+
+def avg(agg, i):
+    if agg is None or not agg[i + 1]:
+        return None
+    return agg[i] / agg[i + 1]
+
+
+def aggregate_rows(rows, bucket_seconds):
+    # Python fallback for bucket_aggregate over range_query-shaped rows
+    buckets = {}
+    for host, _, _, temp, hum, ts in rows:
+        key = (ts // bucket_seconds * bucket_seconds, host)
+        agg = buckets.get(key)
+        if agg is None:
+            agg = buckets[key] = new_agg()
+        add_value(agg, TEMP_SUM, temp)
+        add_value(agg, HUM_SUM, hum)
+    return [(b, h, *agg) for (b, h), agg in sorted(buckets.items(), reverse=True)]
+
+
+def ts_text(epoch):
+    # SQLite ts column format (same as current_timestamp)
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def text_ts(text):
+    return datetime.strptime(text, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+
+
+class MemoryStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = []
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def append_batch(self, rows):
+        with self.lock:
+            self.rows.extend(tuple(r) for r in rows)
+            self.rows.sort(key=lambda r: r[5])
+        return []
+
+    def range_query(self, start, end, hosts=None):
+        with self.lock:
+            return [
+                r
+                for r in self.rows
+                if start <= r[5] < end and (hosts is None or r[0] in hosts)
+            ]
+
+    def bucket_aggregate(self, bucket_seconds, start, end, hosts=None):
+        return aggregate_rows(self.range_query(start, end, hosts), bucket_seconds)
+
+
+class SqliteStore:
+    # "single" keeps everything in one file at `path`; "monthly" writes one
+    # partition file per month under `path` (see dhtPartitions)
+    SELECT_SQL = "select host, sensor, client_id, temp, hum, ts from dht where ts >= ? and ts < ?"
+    INSERT_SQL = "insert into dht (host, sensor, client_id, temp, hum, ts) values (?, ?, ?, ?, ?, ?)"
+    COLUMNS_SQL = f"select {dhtPartitions.EPOCH_COLUMNS} from dht where ts >= ? and ts < ? and host = ?"
+    BUCKET_SQL = """
+        select cast(strftime('%s', ts) as integer) / {seconds} * {seconds} as b, host,
+          coalesce(sum(temp), 0), count(temp), min(temp), max(temp),
+          coalesce(sum(hum), 0), count(hum), min(hum), max(hum)
+        from dht
+        where ts >= ? and ts < ?{hosts}
+        group by b, host
+        order by b desc
+    """
+
+    def __init__(self, path, layout="single", journal_mode="wal", synchronous="normal",
+                 retention_months=0, archive_dir=None):
+        self.path = path
+        self.layout = layout
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.retention_months = retention_months
+        self.archive_dir = archive_dir
+        # sqlite3 connections are per thread; writers keep theirs open
+        self.local = threading.local()
+
+    def open(self):
+        if self.layout == "monthly":
+            os.makedirs(self.path, exist_ok=True)
+        else:
+            # Creates the schema so readers can open the file read-only
+            self._con("")
+
+    def close(self):
+        for con in getattr(self.local, "cons", {}).values():
+            con.close()
+        self.local.cons = {}
+
+    def _con(self, key):
+        cons = getattr(self.local, "cons", None)
+        if cons is None:
+            cons = self.local.cons = {}
+        con = cons.get(key)
+        if con is None:
+            if key:
+                dhtPartitions.apply_retention(self.path, self.retention_months, self.archive_dir)
+                path = dhtPartitions.partition_path(self.path, key)
+            else:
+                path = self.path
+            con = cons[key] = dhtPartitions.open_db(path, self.journal_mode, self.synchronous)
+            if len(cons) > 2:
+                # Only the newest months receive rows; close the rest
+                for old in sorted(cons)[:-2]:
+                    cons.pop(old).close()
+        return con
+
+    def append_batch(self, rows):
+        # Rows are written per partition, one transaction each. If a later
+        # partition fails, the rows of it and those after it are returned so
+        # the caller can retry them without duplicates.
+        groups = {}
+        for row in rows:
+            host, sensor, client_id, temp, hum, ts = row
+            text = ts_text(ts)
+            key = dhtPartitions.month_of(text) if self.layout == "monthly" else ""
+            groups.setdefault(key, []).append((row, (host, sensor, client_id, temp, hum, text)))
+        groups = sorted(groups.items())
+        for i, (key, group) in enumerate(groups):
+            try:
+                con = self._con(key)
+                with con:
+                    con.executemany(self.INSERT_SQL, [g[1] for g in group])
+            except Exception as e:
+                self.close()
+                if not i:
+                    raise
+                print(f"Write to partition {key} failed: {e}")
+                return [g[0] for _, group in groups[i:] for g in group]
+        return []
+
+    def _read(self):
+        # Read-only connection for the single file; partitions are attached
+        # by dhtPartitions.range_query
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+
+    def range_query(self, start, end, hosts=None):
+        a, b = ts_text(start), ts_text(end)
+        rows = []
+        # One query per host so the (host, ts) index bounds each read
+        for host in hosts if hosts is not None else [None]:
+            if self.layout == "monthly":
+                rows += dhtPartitions.range_query(self.path, a, b, host)
+                continue
+            sql, params = self.SELECT_SQL, [a, b]
+            if host is not None:
+                sql, params = sql + " and host = ?", params + [host]
+            con = self._read()
+            try:
+                rows += con.execute(sql + " order by ts", params).fetchall()
+            finally:
+                con.close()
+        if hosts is not None and len(hosts) > 1:
+            rows.sort(key=lambda r: r[5])
+        return [(h, s, c, t, hu, text_ts(ts)) for h, s, c, t, hu, ts in rows]
+
+    def range_columns(self, start, end, hosts=None):
+        # Columns for dhtAggregate (NumpyEngine): SQLite computes the epoch
+        # seconds and each host's rows go straight into one float array, so
+        # no per-row tuples or timestamp parsing in Python
+        if hosts is None:
+            import dhtAggregate
+
+            return dhtAggregate.columns_from_rows(self.range_query(start, end), None)
+        import numpy as np
+
+        a, b = ts_text(start), ts_text(end)
+        parts = []
+        for host in hosts:
+            if self.layout == "monthly":
+                rows = dhtPartitions.range_query(self.path, a, b, host, dhtPartitions.EPOCH_COLUMNS, "epoch")
+            else:
+                con = self._read()
+                try:
+                    rows = con.execute(self.COLUMNS_SQL, (a, b, host)).fetchall()
+                finally:
+                    con.close()
+            # None (NULL) becomes NaN
+            parts.append(np.array(rows, dtype=np.float64).reshape(-1, 3))
+        data = np.concatenate(parts) if parts else np.empty((0, 3))
+        host_idx = [np.full(len(p), i, dtype=np.int64) for i, p in enumerate(parts)]
+        host_idx = np.concatenate(host_idx) if parts else np.empty(0, dtype=np.int64)
+        return data[:, 0], host_idx, data[:, 1], data[:, 2], list(hosts)
+
+    def bucket_aggregate(self, bucket_seconds, start, end, hosts=None):
+        if self.layout == "monthly":
+            return aggregate_rows(self.range_query(start, end, hosts), bucket_seconds)
+        params = [ts_text(start), ts_text(end)]
+        host_sql = ""
+        if hosts is not None:
+            host_sql = " and host in (%s)" % ",".join("?" * len(hosts))
+            params += list(hosts)
+        sql = self.BUCKET_SQL.format(seconds=int(bucket_seconds), hosts=host_sql)
+        con = self._read()
+        try:
+            return con.execute(sql, params).fetchall()
+        finally:
+            con.close()
+
+
+class PostgresStore:
+    # Uses the iso.dht table, plus its rollups when installed (see dhtRollups)
+    INSERT_SQL = "INSERT INTO iso.dht (host, sensor, client_id, temp, hum, ts) VALUES (%s, %s, %s, %s, %s, to_timestamp(%s))"
+    RANGE_SQL = """
+        SELECT host, sensor, client_id, temp, hum, extract(epoch FROM ts)::float8
+        FROM iso.dht
+        WHERE ts >= %s AND ts < %s AND host = ANY(%s)
+        ORDER BY ts
+    """
+    BUCKET_SQL = """
+        SELECT
+          floor(extract(epoch FROM ts) / %s) * %s AS b,
+          host,
+          coalesce(SUM(temp), 0), COUNT(temp), MIN(temp), MAX(temp),
+          coalesce(SUM(hum), 0), COUNT(hum), MIN(hum), MAX(hum)
+        FROM iso.dht
+        WHERE ts >= %s AND ts < %s AND host = ANY(%s)
+        GROUP BY b, host
+        ORDER BY b DESC
+    """
+    # Same shape as BUCKET_SQL, but re-bucketing rollup rows
+    ROLLUP_BUCKET_SQL = """
+        SELECT
+          floor(extract(epoch FROM bucket_start) / %s) * %s AS b,
+          host,
+          SUM(temp_sum), SUM(temp_count)::bigint, MIN(temp_min), MAX(temp_max),
+          SUM(hum_sum), SUM(hum_count)::bigint, MIN(hum_min), MAX(hum_max)
+        FROM {table}
+        WHERE bucket_start >= %s AND bucket_start < %s AND host = ANY(%s)
+        GROUP BY b, host
+        ORDER BY b DESC
+    """
+    # Lets the window predicates above be an index range scan per host
+    INDEX_NAME = "dht_host_ts"
+    INDEX_SQL = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} ON iso.dht (host, ts)"
+
+    def __init__(self, dsn, min_size=1, max_size=4, rollups=True, hosts=None):
+        from psycopg_pool import ConnectionPool
+
+        self.dsn = dsn
+        self.pool = ConnectionPool(dsn, min_size=min_size, max_size=max_size, open=False)
+        self.want_rollups = rollups
+        self.use_rollups = False
+        # Queries always filter on host so the (host, ts) index applies
+        self.hosts = hosts
+
+    def open(self):
+        self.pool.open()
+        # CREATE INDEX CONCURRENTLY takes long on a big table and is not
+        # for every worker to start at boot; `python dhtBucket.py index` runs it
+        try:
+            if not self.index_exists():
+                print(f"Index iso.{self.INDEX_NAME} missing; run `python dhtBucket.py index`")
+        except Exception as e:
+            print("Index check failed:", e)
+        if self.want_rollups:
+            try:
+                self.use_rollups = self.rollups_installed()
+            except Exception as e:
+                print("Rollup check failed:", e)
+            if not self.use_rollups:
+                print("Rollups not installed; run `python dhtRollups.py backfill`")
+
+    def close(self):
+        self.pool.close()
+
+    def index_exists(self):
+        with self.pool.connection() as conn:
+            cur = conn.execute("SELECT to_regclass(%s)", (f"iso.{self.INDEX_NAME}",))
+            return cur.fetchone()[0] is not None
+
+    def ensure_index(self):
+        # CONCURRENTLY can't run inside a transaction, so use a separate
+        # autocommit connection rather than one from the pool
+        import psycopg
+
+        with psycopg.connect(self.dsn, autocommit=True) as conn:
+            cur = conn.execute("SELECT to_regclass(%s)", (f"iso.{self.INDEX_NAME}",))
+            if cur.fetchone()[0] is not None:
+                return False
+            print(f"Creating index iso.{self.INDEX_NAME} on iso.dht (host, ts)")
+            conn.execute(self.INDEX_SQL)
+            return True
+
+    def rollups_installed(self):
+        with self.pool.connection() as conn:
+            for _, table in ROLLUPS:
+                cur = conn.execute("SELECT to_regclass(%s)", (table,))
+                if cur.fetchone()[0] is None:
+                    return False
+        return True
+
+    def _hosts(self, hosts):
+        hosts = hosts if hosts is not None else self.hosts
+        if hosts is None:
+            raise ValueError("PostgresStore queries need a host list")
+        return list(hosts)
+
+    def append_batch(self, rows):
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany(self.INSERT_SQL, list(rows))
+        return []
+
+    def range_query(self, start, end, hosts=None):
+        params = (ts_param(start), ts_param(end), self._hosts(hosts))
+        with self.pool.connection() as conn:
+            return conn.execute(self.RANGE_SQL, params).fetchall()
+
+    def bucket_query(self, bucket_seconds, start, end, hosts=None, rollups=None):
+        # (sql, params) for bucket_aggregate, also used by the EXPLAIN check
+        if rollups is None:
+            rollups = self.use_rollups
+        sql = self.BUCKET_SQL
+        if rollups:
+            table = rollup_for(bucket_seconds)
+            if table is not None:
+                sql = self.ROLLUP_BUCKET_SQL.format(table=table)
+        params = (bucket_seconds, bucket_seconds, ts_param(start), ts_param(end))
+        return sql, params + (self._hosts(hosts),)
+
+    def bucket_aggregate(self, bucket_seconds, start, end, hosts=None):
+        sql, params = self.bucket_query(bucket_seconds, start, end, hosts)
+        with self.pool.connection() as conn:
+            return [(float(r[0]),) + tuple(r[1:]) for r in conn.execute(sql, params)]
+
+
+class TieredStore:
+    # Hot store for recent data, cold (read-only) store for everything before
+    # the start of the day `hot_days` ago that has been exported to it. Writes
+    # always go to the hot store.
+    def __init__(self, hot, cold, hot_days):
+        self.hot = hot
+        self.cold = cold
+        self.hot_days = hot_days
+
+    def open(self):
+        self.hot.open()
+        self.cold.open()
+
+    def close(self):
+        self.hot.close()
+        self.cold.close()
+
+    def retention_cutoff(self):
+        # Days before this are due for export to the cold store
+        return (int(time.time()) // 86400 - self.hot_days) * 86400
+
+    def cutoff(self):
+        # Reads before this go to the cold store. Days past its newest export
+        # are still read from the hot store, so a late or missed export
+        # doesn't make them come back empty.
+        newest = self.cold.newest_day()
+        if newest is None:
+            return float("-inf")
+        return min(self.retention_cutoff(), newest + 86400)
+
+    def append_batch(self, rows):
+        return self.hot.append_batch(rows)
+
+    def _split(self, op, start, end, hosts, *args):
+        # Both tiers get the host list: Postgres needs one, and it bounds
+        # each tier's reads to those hosts
+        cut = self.cutoff()
+        parts = []
+        if start < cut:
+            parts.append(getattr(self.cold, op)(*args, start, min(end, cut), hosts))
+        if end > cut:
+            parts.append(getattr(self.hot, op)(*args, max(start, cut), end, hosts))
+        return parts
+
+    def range_query(self, start, end, hosts=None):
+        # Cold rows all precede the cutoff, so the parts are already in order
+        return [r for part in self._split("range_query", start, end, hosts) for r in part]
+
+    def bucket_aggregate(self, bucket_seconds, start, end, hosts=None):
+        # A bucket straddling the cutoff gets partial aggregates from both sides
+        parts = self._split("bucket_aggregate", start, end, hosts, bucket_seconds)
+        return merge_aggregates([r for part in parts for r in part])
+
+
+def merge_aggregates(rows):
+    # Combine bucket_aggregate rows that share (bucket_start, host)
+    merged = {}
+    for r in rows:
+        key = (float(r[0]), r[1])
+        agg = merged.get(key)
+        if agg is None:
+            merged[key] = list(r[2:])
+            continue
+        for i in (TEMP_SUM, HUM_SUM):
+            agg[i] += r[2 + i]
+            agg[i + 1] += r[3 + i]
+            lo, hi = r[4 + i], r[5 + i]
+            if lo is not None and (agg[i + 2] is None or lo < agg[i + 2]):
+                agg[i + 2] = lo
+            if hi is not None and (agg[i + 3] is None or hi > agg[i + 3]):
+                agg[i + 3] = hi
+    return [(b, h, *agg) for (b, h), agg in sorted(merged.items(), reverse=True)]
+
+
+def rollup_for(bucket_seconds):
+    # Coarsest rollup whose bucket evenly divides the requested one, or None
+    for seconds, table in reversed(ROLLUPS):
+        if bucket_seconds % seconds == 0:
+            return table
+    return None
+
+
+def ts_param(epoch):
+    # Sent as an untyped literal so Postgres casts it to the column's own type
+    # (timestamp or timestamptz) and keeps the predicate indexable
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat(sep=" ")
+
+
+def store_from_config(get):
+    # get(name, default) reads a setting, e.g. os.environ.get or a wrapper
+    # around starlette's Config. DHT_BACKEND is sqlite, postgres or memory.
+    # With DHT_COLD_DIR set, reads older than DHT_HOT_DAYS come from the
+    # columnar archive there (see dhtArchive).
+    store = backend_from_config(get)
+    cold_dir = get("DHT_COLD_DIR", None)
+    if cold_dir:
+        import dhtArchive
+
+        hot_days = int(get("DHT_HOT_DAYS", "30"))
+        store = TieredStore(store, dhtArchive.ArchiveStore(cold_dir), hot_days)
+    return store
+
+
+def backend_from_config(get):
+    backend = get("DHT_BACKEND", "sqlite")
+    if backend == "memory":
+        return MemoryStore()
+    if backend == "postgres":
+        hosts = get("DHT_HOSTS", "")
+        return PostgresStore(
+            get("PSQL_DSN", None),
+            min_size=int(get("PSQL_POOL_MIN", "1")),
+            max_size=int(get("PSQL_POOL_MAX", "4")),
+            rollups=str(get("PSQL_ROLLUPS", "true")).lower() in ("1", "true", "yes", "on"),
+            hosts=hosts.split(",") if hosts else None,
+        )
+    if backend == "sqlite":
+        layout = get("DHT_STORAGE", "single")
+        if layout == "monthly":
+            path = get("DHT_DB_DIR", "/home/andre/dhtHost/db/dht")
+        else:
+            path = get("DHT_DB", "/home/andre/dhtHost/db/dht.db")
+        archive_dir = get("DHT_ARCHIVE_DIR", None) or None
+        return SqliteStore(
+            path,
+            layout=layout,
+            journal_mode=get("DHT_JOURNAL_MODE", "wal"),
+            synchronous=get("DHT_SYNCHRONOUS", "normal"),
+            retention_months=int(get("DHT_RETENTION_MONTHS", "0")),
+            archive_dir=archive_dir,
+        )
+    raise ValueError(f"unknown DHT_BACKEND '{backend}'")
+
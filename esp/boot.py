@@ -9,6 +9,8 @@ import ubinascii
 import micropython
 import esp
 import network
+import config
+import wifi
 
 
 gc.collect()
@@ -17,39 +19,19 @@ ssid = 'BobsHauntedGecko'
 password = 'tkgr6073'
 mqtt_server = 'mqtt.lan'
 
-print('Connecting...')
-
-station = network.WLAN(network.STA_IF)
-
-station.active(True)
-
-while True:
-    try:
-        station.connect(ssid, password)
-        # break
-    except OSError as e:
-        print(e)
-
-    if station.isconnected():
-        print('Connected')
-        break
-    else:
-        print('Trying again in 1 seconds')
-        time.sleep(1)
-
-
-# while station.isconnected() == False:
-#  pass
-
-
-net = network.WLAN(network.STA_IF)
-net.active(True)
-
-print('Connection successful')
-print(station.ifconfig())
-
-ip = station.ifconfig()[0]
-
+station = wifi.station
+ip = None
+
+if config.MODE == 'deepsleep' and machine.reset_cause() == machine.DEEPSLEEP_RESET:
+    # Woken from deep sleep: main.py connects only on the wakes that publish,
+    # with the access point cached in RTC memory
+    pass
+else:
+    print('Connecting...')
+    wifi.connect(ssid, password)
+    print('Connection successful')
+    print(station.ifconfig())
+    ip = station.ifconfig()[0]
 
 
 wlan = network.WLAN(network.STA_IF)
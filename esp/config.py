@@ -0,0 +1,29 @@
+# Node settings, read by boot.py and main.py
+
+# "awake": stay connected, measure every MEASURE_INTERVAL seconds and listen
+# on dht_sensor_cmd (mains powered nodes)
+# "deepsleep": wake, measure, deep sleep MEASURE_INTERVAL seconds; readings
+# wait in RTC memory and are published every WIFI_EVERY wakes (battery nodes,
+# which do not receive commands)
+MODE = 'awake'
+MEASURE_INTERVAL = 15
+WIFI_EVERY = 4
+
+# Measurement payload: 'json' on dht_sensor_measurement, or 'binary' on
+# dht_sensor_measurement_bin (smaller, for nodes talking only to the server;
+# the LCD reads the JSON topic). Never both: the logger and server ingest
+# either topic, so a reading sent on both would be stored twice.
+PAYLOAD = 'json'
+
+# QoS of measurement publishes. With 1, up to MQTT_WINDOW of them are in
+# flight at once instead of waiting for each PUBACK; unacknowledged ones are
+# retransmitted, and sent again after a reconnect.
+QOS = 1
+MQTT_WINDOW = 4
+
+# Seconds a deepsleep wake tries Wi-Fi before giving up until the next
+# publishing wake
+WIFI_TIMEOUT = 10
+
+# (ip, netmask, gateway, dns) to skip DHCP, or None
+STATIC_IP = None
@@ -4,14 +4,19 @@ import time
 import dht
 import network
 import urequests
-from umqttsimple import MQTTClient
+from umqttsimple import MQTTClient, MQTTException
 import ubinascii
 import micropython
 import esp
 from boot import ip
+import ntptime
+import config
+import payload
+import readings
+import rtcstate
+import wifi
 
 sensor23 = dht.DHT22(machine.Pin(23))
-sensor23.measure()
 
 
 client_id = ubinascii.hexlify(machine.unique_id())
@@ -21,65 +26,210 @@ print(ip)
 
 topic_sensor_cmd = b'dht_sensor_cmd'
 topic_sensor_pub = b'dht_sensor_measurement'
+topic_sensor_pub_bin = b'dht_sensor_measurement_bin'
 
 
 def sub_cb(topic, msg):
+    # Views into the client's receive buffer; copy what is kept
+    topic = bytes(topic)
+    msg = bytes(msg)
     print((topic, msg))
     if topic == topic_sensor_cmd:
         print('DHT.cmd: Received %s' % msg)
 
 
+# Readings are buffered and published BATCH_SIZE at a time (1 publishes each
+# one as it is measured). While the broker or Wi-Fi is down they stay in the
+# buffer, the oldest overwritten after BUFFER_SIZE, and are replayed on
+# reconnect, at most MAX_PER_MESSAGE per message.
+BATCH_SIZE = 4
+BUFFER_SIZE = 240
+MAX_PER_MESSAGE = 20
+RECONNECT_DELAY = 10
+# MQTT packet buffers (and each QoS 1 window slot); fits a full
+# MAX_PER_MESSAGE JSON batch
+MQTT_BUFSIZE = 1024
+
+buffer = readings.Readings(BUFFER_SIZE)
+encoder = payload.Encoder(machine.unique_id(), 14, MAX_PER_MESSAGE)
+# The first `sent` readings in buffer are published and wait for their
+# PUBACK; sent_pids and sent_counts hold each such message's packet id and
+# number of readings, oldest first
+sent = 0
+sent_pids = []
+sent_counts = []
+
+
+def sync_clock():
+    # Readings carry their own timestamps once the RTC is set
+    try:
+        ntptime.settime()
+    except Exception as e:
+        print('NTP failed: %s' % e)
+
+
+# One client for all connections: its QoS 1 window survives a reconnect, and
+# connect() sends the unacknowledged publishes again. A stalled window gives
+# up (OSError) after MAX_RETRIES * retry_ms, well within the watchdog.
+mqtt = MQTTClient(client_id, mqtt_server, bufsize=MQTT_BUFSIZE, window=config.MQTT_WINDOW, retry_ms=2000)
+mqtt.set_callback(sub_cb)
+
+
 def connect_and_subscribe():
     global client_id, mqtt_server, topic_sensor_cmd
-    client = MQTTClient(client_id, mqtt_server)
-    client.set_callback(sub_cb)
+    if not wifi.station.isconnected():
+        wifi.station.connect(ssid, password)
+    client = mqtt
     client.connect()
     client.subscribe(topic_sensor_cmd)
     print('Connected to %s MQTT broker, subscribed to %s topic' % (mqtt_server, topic_sensor_cmd))
     return client
 
 
-def restart_and_reconnect():
-    print('Failed to connect to MQTT broker. Reconnecting...')
-    time.sleep(10)
-    machine.reset()
-
+def publish_buffered(client, minimum):
+    # Oldest first. Readings stay in the buffer (and in RTC memory over deep
+    # sleep) until the broker has acknowledged them: on a lost connection the
+    # client's window sends them again, and after a reset they are published
+    # anew.
+    global sent
+    encoder.set_host(ip)
+    while len(buffer) - sent >= minimum and len(buffer) > sent:
+        n = min(len(buffer) - sent, MAX_PER_MESSAGE)
+        if config.PAYLOAD == 'binary':
+            pid = client.publish(topic_sensor_pub_bin, encoder.binary(buffer, n, sent), qos=config.QOS)
+        else:
+            pid = client.publish(topic_sensor_pub, encoder.json(buffer, n, sent), qos=config.QOS)
+        sent += n
+        sent_pids.append(pid)
+        sent_counts.append(n)
+        release_acked(client)
+
+
+def release_acked(client):
+    # Drop the acknowledged messages' readings, in publishing order
+    global sent
+    while sent_pids and not client.pending(sent_pids[0]):
+        n = sent_counts.pop(0)
+        sent_pids.pop(0)
+        buffer.drop(n)
+        sent -= n
+
+
+def disconnect(client):
+    try:
+        client.sock.close()
+    except Exception:
+        pass
 
-try:
-    client = connect_and_subscribe()
-except OSError as e:
-    restart_and_reconnect()
 
+def measure():
+    global sent
+    try:
+        sensor23.measure()
+        dropped = buffer.dropped
+        buffer.add(readings.now(), sensor23.temperature(), sensor23.humidity())
+        if buffer.dropped != dropped and sent:
+            # A full buffer overwrote the oldest reading, which was already
+            # in flight: it is no longer ours to drop on its PUBACK
+            k = 0
+            while not sent_counts[k]:
+                k += 1
+            sent_counts[k] -= 1
+            sent -= 1
+    except OSError as e:
+        print('DHT read failed: %s' % e)
+
+
+def sleep_cycle():
+    # One wake in deepsleep mode: measure, on every WIFI_EVERY-th wake connect
+    # and publish the buffer, then sleep until the next measurement. Nothing
+    # but RTC memory and the clock survives the sleep.
+    global ip
+    wdt = machine.WDT(timeout=(config.WIFI_TIMEOUT + 15) * 1000)
+    wakes, bssid, channel = rtcstate.load(buffer)
+    measure()
+    wakes += 1
+    if wakes >= config.WIFI_EVERY or len(buffer) == BUFFER_SIZE:
+        wakes = 0
+        if bssid is None:
+            bssid, channel = wifi.find_ap(ssid)
+        if wifi.connect(ssid, password, config.WIFI_TIMEOUT, bssid, channel):
+            ip = wifi.station.ifconfig()[0]
+            wdt.feed()
+            if not readings.now():
+                sync_clock()
+            try:
+                client = connect_and_subscribe()
+                publish_buffered(client, 1)
+                client.drain()
+                release_acked(client)
+                client.disconnect()
+            except (OSError, MQTTException) as e:
+                print('MQTT error: %s; %d readings buffered' % (e, len(buffer)))
+        else:
+            # Rescan next time, the access point may have moved
+            bssid, channel = None, 0
+    rtcstate.save(wakes, bssid, channel, buffer)
+    # Awake time counts towards the interval
+    machine.deepsleep(max(1000, config.MEASURE_INTERVAL * 1000 - time.ticks_ms()))
+
+
+if config.MODE == 'deepsleep':
+    if machine.reset_cause() != machine.DEEPSLEEP_RESET:
+        sync_clock()
+    sleep_cycle()
+
+sync_clock()
+
+client = None
+retry_at = 0
 last_measure = 0
-measure_interval = 15
-
+measure_interval = config.MEASURE_INTERVAL
 
 try:
+    client = connect_and_subscribe()
     data = '{"host": "%s", "client_id": "%s", "event": "starting"}' % (ip, client_id_str)
     client.publish("dht_sensor_events", data)
 except OSError as e:
-    print("OSError: %s" % e)
+    print('Failed to connect to MQTT broker: %s' % e)
+    client = None
+    retry_at = time.time() + RECONNECT_DELAY
 
 
 wdt = machine.WDT(timeout=15000)
 wdt.feed()
 
 while True:
-    gc.collect()
     wdt.feed()
 
-    try:
-        client.check_msg()
-        if (time.time() - last_measure) > measure_interval:
-            sensor23.measure()
-            temp14 = sensor23.temperature()
-            hum14 = sensor23.humidity()
-            data14 = '{"host": "%s", "client_id": "%s", "sensor": %d, "temp": %3.1f, "hum": %3.1f}' % (ip, client_id_str, 14, temp14, hum14)
-            print(data14)
-
-            client.publish(topic_sensor_pub, data14)
-            last_measure = time.time()
-
-        time.sleep(5)
-    except OSError as e:
-        restart_and_reconnect()
+    if (time.time() - last_measure) > measure_interval:
+        measure()
+        last_measure = time.time()
+
+    if client is None and time.time() >= retry_at:
+        try:
+            client = connect_and_subscribe()
+            if not readings.now():
+                sync_clock()
+            # Replay whatever was buffered while disconnected
+            publish_buffered(client, 1)
+        except OSError as e:
+            print('Failed to connect to MQTT broker: %s' % e)
+            if client is not None:
+                disconnect(client)
+            client = None
+            retry_at = time.time() + RECONNECT_DELAY
+
+    if client is not None:
+        try:
+            client.poll()
+            release_acked(client)
+            publish_buffered(client, BATCH_SIZE)
+        except (OSError, MQTTException) as e:
+            # MQTTException: a packet that can never fit the receive buffer
+            print('MQTT error: %s; %d readings buffered' % (e, len(buffer)))
+            disconnect(client)
+            client = None
+            retry_at = time.time() + RECONNECT_DELAY
+
+    time.sleep(5)
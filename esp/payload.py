@@ -0,0 +1,137 @@
+import struct
+import ubinascii
+
+# Measurement payloads built in buffers allocated once per host address, so
+# publishing does not grow the heap. Both formats are read by
+# common/dhtPayload.py:
+#   json()   the dht_sensor_measurement JSON, from a template whose number
+#            fields are rewritten in place (space padded, which JSON allows)
+#   binary() the same readings packed for dht_sensor_measurement_bin
+BIN_MAGIC = b'DHTM'
+BIN_VERSION = 1
+BIN_HEADER = '<4sBB6s4sB'
+BIN_HEADER_SIZE = struct.calcsize(BIN_HEADER)
+BIN_COUNT = BIN_HEADER_SIZE - 1
+
+# "ts", "temp" and "hum" of one reading; *_END are the offsets the values are
+# right-aligned against
+FIELDS = b'"ts":          ,"temp":      ,"hum":     '
+TS_END = 15
+TEMP_END = 29
+HUM_END = 41
+
+
+def pad(buf, start, i):
+    while i > start:
+        i -= 1
+        buf[i] = 32
+
+
+def put_u32(buf, end, width, hi, lo):
+    # hi * 65536 + lo, right-aligned in buf[end - width:end]. Done on 16 bit
+    # halves: a unix time is beyond MicroPython's small ints and would
+    # allocate.
+    i = end
+    while True:
+        cur = hi % 10 * 65536 + lo
+        hi //= 10
+        lo = cur // 10
+        i -= 1
+        buf[i] = 48 + cur % 10
+        if not hi and not lo:
+            break
+    pad(buf, end - width, i)
+
+
+def put_tenths(buf, end, width, v):
+    # v / 10 with one decimal, right-aligned in buf[end - width:end]
+    neg = v < 0
+    if neg:
+        v = -v
+    i = end - 2
+    buf[i + 1] = 48 + v % 10
+    buf[i] = 46
+    v //= 10
+    while True:
+        i -= 1
+        buf[i] = 48 + v % 10
+        v //= 10
+        if not v:
+            break
+    if neg:
+        i -= 1
+        buf[i] = 45
+    pad(buf, end - width, i)
+
+
+def int16(buf, o):
+    v = buf[o] | buf[o + 1] << 8
+    return v - 65536 if v & 0x8000 else v
+
+
+class Encoder:
+    # Payloads for up to capacity readings of one Readings buffer
+    def __init__(self, unique_id, sensor, capacity):
+        self.unique_id = unique_id
+        self.client_id = ubinascii.hexlify(unique_id).decode()
+        self.sensor = sensor
+        self.capacity = capacity
+        self.bin = bytearray(BIN_HEADER_SIZE + capacity * 8)
+        self.bin_view = memoryview(self.bin)
+        self.host = None
+        self.set_host('0.0.0.0')
+
+    def set_host(self, ip):
+        # The address is in every payload; only a change reallocates
+        if ip == self.host:
+            return
+        self.host = ip
+        addr = bytes([int(p) for p in ip.split('.')])
+        struct.pack_into(BIN_HEADER, self.bin, 0, BIN_MAGIC, BIN_VERSION, self.sensor, self.unique_id, addr, 0)
+        head = ('{"host":"%s","client_id":"%s","sensor":%d,' % (ip, self.client_id, self.sensor)).encode()
+        # One reading: {head, fields}
+        self.single = bytearray(head + FIELDS + b'}')
+        self.single_view = memoryview(self.single)
+        # Several: {head, "batch": [{fields}, ...]}; json() ends the list
+        # after the last reading it fills
+        self.batch_head = len(head) + 9
+        self.batch = bytearray(head + b'"batch":[' + (b'{' + FIELDS + b'},') * self.capacity + b'}')
+        self.batch_view = memoryview(self.batch)
+
+    def fields(self, buf, pos, readings, k):
+        # Write the k-th oldest reading into the FIELDS at buf[pos:]
+        rec = readings.buf
+        o = readings.offset(k)
+        put_u32(buf, pos + TS_END, 10, rec[o + 2] | rec[o + 3] << 8, rec[o] | rec[o + 1] << 8)
+        put_tenths(buf, pos + TEMP_END, 6, int16(rec, o + 4))
+        put_tenths(buf, pos + HUM_END, 5, int16(rec, o + 6))
+
+    def json(self, readings, n, first=0):
+        # n readings (n <= capacity) from the first-th oldest on, as JSON
+        if n == 1:
+            self.fields(self.single, len(self.single) - len(FIELDS) - 1, readings, first)
+            return self.single_view
+        buf = self.batch
+        item = len(FIELDS) + 3
+        pos = self.batch_head
+        for k in range(n):
+            buf[pos] = 123
+            self.fields(buf, pos + 1, readings, first + k)
+            pos += item
+            buf[pos - 1] = 44
+        buf[pos - 1] = 93
+        buf[pos] = 125
+        return self.batch_view[:pos + 1]
+
+    def binary(self, readings, n, first=0):
+        # n readings (n <= capacity) from the first-th oldest on, packed
+        buf = self.bin
+        rec = readings.buf
+        buf[BIN_COUNT] = n
+        pos = BIN_HEADER_SIZE
+        for k in range(first, first + n):
+            o = readings.offset(k)
+            for j in range(8):
+                buf[pos + j] = rec[o + j]
+            pos += 8
+        return self.bin_view[:pos]
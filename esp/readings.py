@@ -0,0 +1,84 @@
+import time
+import struct
+
+# Ring buffer of sensor readings kept in one preallocated bytearray, so
+# buffering never allocates. Record: ts (uint32 unix seconds, 0 if the clock
+# is not set), temp and hum (int16, value * 10).
+RECORD = "<Ihh"
+RECORD_SIZE = struct.calcsize(RECORD)
+# dump() header: count, dropped
+DUMP_HEADER = "<HH"
+DUMP_HEADER_SIZE = struct.calcsize(DUMP_HEADER)
+
+# MicroPython on the ESP32 may count from 2000-01-01 instead of 1970
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+
+def now():
+    # Unix time, or 0 while the RTC has not been set (by ntptime). A float
+    # under CPython and the unix port.
+    if time.gmtime()[0] < 2024:
+        return 0
+    return int(time.time()) + EPOCH_OFFSET
+
+
+class Readings:
+    # Oldest first; when full, add() overwrites the oldest reading
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buf = bytearray(capacity * RECORD_SIZE)
+        self.start = 0
+        self.count = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, ts, temp, hum):
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+            self.dropped += 1
+        i = (self.start + self.count) % self.capacity
+        struct.pack_into(RECORD, self.buf, i * RECORD_SIZE, ts, round(temp * 10), round(hum * 10))
+        self.count += 1
+
+    def offset(self, k):
+        # Where in buf the k-th oldest record starts
+        return (self.start + k) % self.capacity * RECORD_SIZE
+
+    def get(self, k):
+        # k-th oldest as (ts, temp, hum)
+        i = (self.start + k) % self.capacity
+        ts, temp, hum = struct.unpack_from(RECORD, self.buf, i * RECORD_SIZE)
+        return ts, temp / 10, hum / 10
+
+    def drop(self, n):
+        # Forget the n oldest, once they have been published
+        n = min(n, self.count)
+        self.start = (self.start + n) % self.capacity
+        self.count -= n
+
+    def dump(self):
+        # The readings, oldest first, for keeping across deep sleep
+        out = bytearray(DUMP_HEADER_SIZE + self.count * RECORD_SIZE)
+        struct.pack_into(DUMP_HEADER, out, 0, self.count, self.dropped)
+        pos = DUMP_HEADER_SIZE
+        for k in range(self.count):
+            i = (self.start + k) % self.capacity * RECORD_SIZE
+            out[pos:pos + RECORD_SIZE] = self.buf[i:i + RECORD_SIZE]
+            pos += RECORD_SIZE
+        return out
+
+    def load(self, data):
+        # Replace the contents with a dump(), keeping the newest if it holds
+        # more than capacity
+        count, dropped = struct.unpack_from(DUMP_HEADER, data)
+        count = min(count, (len(data) - DUMP_HEADER_SIZE) // RECORD_SIZE)
+        skip = max(0, count - self.capacity)
+        n = count - skip
+        pos = DUMP_HEADER_SIZE + skip * RECORD_SIZE
+        self.buf[:n * RECORD_SIZE] = data[pos:pos + n * RECORD_SIZE]
+        self.start = 0
+        self.count = n
+        self.dropped = dropped + skip
@@ -0,0 +1,29 @@
+import struct
+import machine
+
+# State kept in RTC memory across deep sleep: magic, wakes since the last
+# publish, cached access point channel and BSSID, then Readings.dump(). It is
+# lost on power loss or a hard reset, after which the node starts over with an
+# empty buffer and a fresh scan.
+MAGIC = b'DHT1'
+HEADER = '<4sHB6s'
+HEADER_SIZE = struct.calcsize(HEADER)
+
+rtc = machine.RTC()
+
+
+def load(buffer):
+    # (wakes, bssid or None, channel), and buffer filled with the saved readings
+    data = rtc.memory()
+    if len(data) < HEADER_SIZE:
+        return 0, None, 0
+    magic, wakes, channel, bssid = struct.unpack_from(HEADER, data)
+    if magic != MAGIC:
+        return 0, None, 0
+    buffer.load(memoryview(data)[HEADER_SIZE:])
+    return wakes, (bssid if channel else None), channel
+
+
+def save(wakes, bssid, channel, buffer):
+    # ESP32 RTC user memory is 2 KB: room for about 250 readings
+    rtc.memory(struct.pack(HEADER, MAGIC, wakes, channel if bssid else 0, bssid or bytes(6)) + buffer.dump())
@@ -4,6 +4,18 @@ except:
     import socket
 import ustruct as struct
 from ubinascii import hexlify
+try:
+    from uerrno import EAGAIN, ETIMEDOUT
+except ImportError:
+    from errno import EAGAIN, ETIMEDOUT
+try:
+    from utime import ticks_ms, ticks_diff, sleep_ms
+except ImportError:
+    from time import ticks_ms, ticks_diff, sleep_ms
+
+# Retransmissions of a windowed QoS 1 publish before giving up on the
+# connection
+MAX_RETRIES = 3
 
 class MQTTException(Exception):
     pass
@@ -11,7 +23,7 @@ class MQTTException(Exception):
 class MQTTClient:
 
     def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
-                 ssl=False, ssl_params={}):
+                 ssl=False, ssl_params={}, bufsize=0, window=0, retry_ms=5000):
         if port == 0:
             port = 8883 if ssl else 1883
         self.client_id = client_id
@@ -29,11 +41,71 @@ class MQTTClient:
         self.lw_msg = None
         self.lw_qos = 0
         self.lw_retain = False
+        # Buffered mode (bufsize > 0): packets are assembled in one
+        # preallocated buffer and sent with a single write, and poll() reads
+        # into another without blocking.
+        self.tx = None
+        self.rx = None
+        if bufsize:
+            self.tx = bytearray(bufsize)
+            self.txv = memoryview(self.tx)
+            self.rx = bytearray(bufsize)
+            self.rxv = memoryview(self.rx)
+            self.ack = bytearray(b"\x40\x02\0\0")
+        self.rx_len = 0
+        self.acked = 0
+        # QoS 1 window (buffered mode): up to window publishes awaiting their
+        # PUBACK, each kept in its own slot buffer; one unacknowledged for
+        # retry_ms is sent again with DUP set, as are all of them on connect()
+        self.window = window if bufsize else 0
+        self.retry_ms = retry_ms
+        self.slots = [bytearray(bufsize) for _ in range(self.window)]
+        self.slot_views = [memoryview(b) for b in self.slots]
+        self.slot_pid = [0] * self.window
+        self.slot_len = [0] * self.window
+        self.slot_at = [0] * self.window
+        self.slot_tries = [0] * self.window
 
     def _send_str(self, s):
         self.sock.write(struct.pack("!H", len(s)))
         self.sock.write(s)
 
+    def _next_pid(self):
+        self.pid = self.pid % 65535 + 1
+        return self.pid
+
+    def _put_len(self, buf, pos, sz):
+        # Remaining length varint at buf[pos:], returns where it ends
+        while sz > 0x7f:
+            buf[pos] = (sz & 0x7f) | 0x80
+            sz >>= 7
+            pos += 1
+        buf[pos] = sz
+        return pos + 1
+
+    def _put_str(self, buf, pos, s):
+        n = len(s)
+        buf[pos] = n >> 8
+        buf[pos + 1] = n & 0xff
+        buf[pos + 2:pos + 2 + n] = s
+        return pos + 2 + n
+
+    def _put_publish(self, buf, topic, msg, retain, qos, pid):
+        # PUBLISH packet in buf, returns its length, or 0 if it does not fit
+        sz = 2 + len(topic) + len(msg)
+        if qos:
+            sz += 2
+        if sz + 5 > len(buf):
+            return 0
+        buf[0] = 0x30 | qos << 1 | retain
+        pos = self._put_str(buf, self._put_len(buf, 1, sz), topic)
+        if qos:
+            buf[pos] = pid >> 8
+            buf[pos + 1] = pid & 0xff
+            pos += 2
+        buf[pos:pos + len(msg)] = msg
+        return pos + len(msg)
+
     def _recv_len(self):
         n = 0
         sh = 0
@@ -97,9 +169,14 @@ class MQTTClient:
             self._send_str(self.user)
             self._send_str(self.pswd)
         resp = self.sock.read(4)
+        self.rx_len = 0
         assert resp[0] == 0x20 and resp[1] == 0x02
         if resp[3] != 0:
             raise MQTTException(resp[3])
+        for i in range(self.window):
+            if self.slot_pid[i]:
+                self.slot_tries[i] = 0
+                self._resend(i)
         return resp[2] & 1
 
     def disconnect(self):
@@ -109,7 +186,32 @@ class MQTTClient:
     def ping(self):
         self.sock.write(b"\xc0\0")
 
+    # Returns the packet id (0 for QoS 0); with a window, the publish may
+    # still be pending() when this returns
     def publish(self, topic, msg, retain=False, qos=0):
+        assert qos in (0, 1)
+        pid = self._next_pid() if qos else 0
+        if self.tx is not None:
+            if isinstance(topic, str):
+                topic = topic.encode()
+            if isinstance(msg, str):
+                msg = msg.encode()
+            if qos and self.window:
+                i = self._free_slot()
+                n = self._put_publish(self.slots[i], topic, msg, retain, qos, pid)
+                if n:
+                    self.sock.write(self.slot_views[i][:n])
+                    self.slot_pid[i] = pid
+                    self.slot_len[i] = n
+                    self.slot_at[i] = ticks_ms()
+                    self.slot_tries[i] = 0
+                    return pid
+            n = self._put_publish(self.tx, topic, msg, retain, qos, pid)
+            if n:
+                self.sock.write(self.txv[:n])
+                if qos:
+                    self._wait_ack(pid)
+                return pid
         pkt = bytearray(b"\x30\0\0\0")
         pkt[0] |= qos << 1 | retain
         sz = 2 + len(topic) + len(msg)
@@ -126,29 +228,85 @@ class MQTTClient:
         self.sock.write(pkt, i + 1)
         self._send_str(topic)
         if qos > 0:
-            self.pid += 1
-            pid = self.pid
             struct.pack_into("!H", pkt, 0, pid)
             self.sock.write(pkt, 2)
         self.sock.write(msg)
         if qos == 1:
-            while 1:
-                op = self.wait_msg()
-                if op == 0x40:
-                    sz = self.sock.read(1)
-                    assert sz == b"\x02"
-                    rcv_pid = self.sock.read(2)
-                    rcv_pid = rcv_pid[0] << 8 | rcv_pid[1]
-                    if pid == rcv_pid:
-                        return
-        elif qos == 2:
-            assert 0
+            self._wait_ack(pid)
+        return pid
+
+    def _free_slot(self):
+        # A free window slot, polling for PUBACKs while all are taken
+        while 1:
+            for i in range(self.window):
+                if not self.slot_pid[i]:
+                    return i
+            self.poll()
+            sleep_ms(10)
+
+    def _resend(self, i):
+        self.slots[i][0] |= 0x08
+        self.sock.write(self.slot_views[i][:self.slot_len[i]])
+        self.slot_at[i] = ticks_ms()
+        self.slot_tries[i] += 1
+
+    def _retransmit(self):
+        now = ticks_ms()
+        for i in range(self.window):
+            if self.slot_pid[i] and ticks_diff(now, self.slot_at[i]) >= self.retry_ms:
+                if self.slot_tries[i] >= MAX_RETRIES:
+                    raise OSError(ETIMEDOUT)
+                self._resend(i)
+
+    # Publishes in the QoS 1 window not yet acknowledged
+    def inflight(self):
+        return self.window - self.slot_pid.count(0)
+
+    # Whether the QoS 1 publish with packet id pid awaits its PUBACK
+    def pending(self, pid):
+        return pid != 0 and pid in self.slot_pid
+
+    # Wait until the whole QoS 1 window is acknowledged, e.g. before a
+    # disconnect. Raises OSError if the server stops answering.
+    def drain(self):
+        while self.inflight():
+            self.poll()
+            sleep_ms(10)
+
+    def _wait_ack(self, pid):
+        # Block until the PUBACK or SUBACK for pid, handling other messages
+        if self.rx is not None:
+            while self.acked != pid:
+                self._fill(True)
+                self._parse()
+            return
+        while 1:
+            op = self.wait_msg()
+            if op == 0x40:
+                sz = self.sock.read(1)
+                assert sz == b"\x02"
+                rcv_pid = self.sock.read(2)
+                rcv_pid = rcv_pid[0] << 8 | rcv_pid[1]
+                if pid == rcv_pid:
+                    return
 
     def subscribe(self, topic, qos=0):
         assert self.cb is not None, "Subscribe callback is not set"
+        pid = self._next_pid()
+        if self.rx is not None:
+            if isinstance(topic, str):
+                topic = topic.encode()
+            self.tx[0] = 0x82
+            pos = self._put_len(self.tx, 1, 2 + 2 + len(topic) + 1)
+            self.tx[pos] = pid >> 8
+            self.tx[pos + 1] = pid & 0xff
+            pos = self._put_str(self.tx, pos + 2, topic)
+            self.tx[pos] = qos
+            self.sock.write(self.txv[:pos + 1])
+            self._wait_ack(pid)
+            return
         pkt = bytearray(b"\x82\0\0\0")
-        self.pid += 1
-        struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic) + 1, self.pid)
+        struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic) + 1, pid)
         #print(hex(len(pkt)), hexlify(pkt, ":"))
         self.sock.write(pkt)
         self._send_str(topic)
@@ -203,5 +361,94 @@ class MQTTClient:
     # If not, returns immediately with None. Otherwise, does
     # the same processing as wait_msg.
     def check_msg(self):
+        if self.rx is not None:
+            return self.poll()
         self.sock.setblocking(False)
         return self.wait_msg()
+
+    # Buffered mode: handle whatever the server has sent so far and return
+    # the type of the last packet, or None. Never blocks; a partly received
+    # packet stays in the receive buffer until the rest arrives. The
+    # callback gets topic and message as memoryviews into that buffer, valid
+    # only until it returns. Also retransmits overdue QoS 1 publishes.
+    def poll(self):
+        self._fill(False)
+        op = self._parse()
+        if self.window:
+            self._retransmit()
+        return op
+
+    def _fill(self, block):
+        if self.rx_len == len(self.rx):
+            raise MQTTException("packet larger than receive buffer")
+        self.sock.setblocking(block)
+        try:
+            n = self.sock.readinto(self.rxv[self.rx_len:])
+        except OSError as e:
+            if e.args[0] != EAGAIN:
+                raise
+            n = None
+        finally:
+            self.sock.setblocking(True)
+        if n is None:
+            return
+        if n == 0:
+            raise OSError(-1)
+        self.rx_len += n
+
+    def _parse(self):
+        rx = self.rx
+        pos = 0
+        op = None
+        while pos < self.rx_len:
+            # Fixed header: type, then the remaining length varint
+            i = pos + 1
+            sz = 0
+            sh = 0
+            while i < self.rx_len:
+                b = rx[i]
+                i += 1
+                sz |= (b & 0x7f) << sh
+                if not b & 0x80:
+                    break
+                sh += 7
+            else:
+                break
+            # Measured from pos: the tail is moved to the start below
+            if i - pos + sz > len(rx):
+                raise MQTTException("packet larger than receive buffer")
+            if i + sz > self.rx_len:
+                break
+            op = rx[pos]
+            if op & 0xf0 == 0x30:
+                n = rx[i] << 8 | rx[i + 1]
+                topic = self.rxv[i + 2:i + 2 + n]
+                p = i + 2 + n
+                if op & 6:
+                    pid = rx[p] << 8 | rx[p + 1]
+                    p += 2
+                self.cb(topic, self.rxv[p:i + sz])
+                if op & 6 == 2:
+                    self.ack[2] = pid >> 8
+                    self.ack[3] = pid & 0xff
+                    self.sock.write(self.ack)
+                elif op & 6 == 4:
+                    assert 0
+            elif op == 0x40:
+                pid = rx[i] << 8 | rx[i + 1]
+                self.acked = pid
+                for k in range(self.window):
+                    if self.slot_pid[k] == pid:
+                        self.slot_pid[k] = 0
+            elif op == 0x90:
+                if rx[i + 2] == 0x80:
+                    raise MQTTException(0x80)
+                self.acked = rx[i] << 8 | rx[i + 1]
+            pos = i + sz
+        # Keep the unparsed tail at the start of the buffer
+        n = self.rx_len - pos
+        if pos:
+            for j in range(n):
+                rx[j] = rx[pos + j]
+        self.rx_len = n
+        return op
@@ -0,0 +1,87 @@
+# Heap allocated per measurement publish: the old % formatted payload and
+# unbuffered publish, against esp/payload.py with the buffered client.
+# For the MicroPython unix port, from the repo root:
+#   micropython esp/unix/bench_alloc.py
+# Under CPython (python esp/unix/bench_alloc.py) it only times the cases;
+# heap accounting needs MicroPython's gc.mem_alloc().
+import gc
+import sys
+
+sys.path.append(__file__.rsplit('/', 1)[0])
+sys.path.append(__file__.rsplit('/', 2)[0])
+
+try:
+    from utime import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+import payload
+import readings
+from umqttsimple import MQTTClient
+
+N = 1000
+IP = '10.0.0.32'
+UNIQUE_ID = b'\xa1\xb2\xc3\xd4\xe5\xf6'
+CLIENT_ID = 'a1b2c3d4e5f6'
+TOPIC = b'dht_sensor_measurement'
+TOPIC_BIN = b'dht_sensor_measurement_bin'
+
+
+class Sink:
+    # Socket that swallows writes
+    def write(self, buf, n=None):
+        return len(buf) if n is None else n
+
+
+def client(bufsize):
+    c = MQTTClient(b'bench', 'localhost', bufsize=bufsize)
+    c.sock = Sink()
+    return c
+
+
+def run(name, publish):
+    publish()  # warm up: first-use allocations are not per publish
+    gc.collect()
+    heap = hasattr(gc, 'mem_alloc')
+    if heap:
+        gc.disable()
+        before = gc.mem_alloc()
+    t = ticks_us()
+    for _ in range(N):
+        publish()
+    us = ticks_diff(ticks_us(), t) / N
+    if heap:
+        per = (gc.mem_alloc() - before) / N
+        gc.enable()
+        print('%-28s %7.1f us %7.1f bytes/publish' % (name, us, per))
+    else:
+        print('%-28s %7.1f us' % (name, us))
+
+
+def main():
+    buf = readings.Readings(20)
+    for k in range(4):
+        buf.add(1760000000 + 15 * k, 21.5 + k / 10, 40.1)
+    enc = payload.Encoder(UNIQUE_ID, 14, 20)
+    enc.set_host(IP)
+    plain = client(0)
+    buffered = client(1024)
+
+    def old_format():
+        ts, temp, hum = buf.get(0)
+        data = '{"host": "%s", "client_id": "%s", "sensor": %d, "temp": %3.1f, "hum": %3.1f}' % (IP, CLIENT_ID, 14, temp, hum)
+        plain.publish(TOPIC, data)
+
+    run('% format, unbuffered', old_format)
+    run('json template, buffered', lambda: buffered.publish(TOPIC, enc.json(buf, 1)))
+    run('json batch of 4, buffered', lambda: buffered.publish(TOPIC, enc.json(buf, 4)))
+    run('binary batch of 4, buffered', lambda: buffered.publish(TOPIC_BIN, enc.binary(buf, 4)))
+
+
+main()
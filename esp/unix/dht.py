@@ -0,0 +1,21 @@
+# CPython stand-in for the MicroPython module of the same name. Set
+# temperature and humidity, or failing to make measure() raise like a sensor
+# timeout
+temperature = 21.5
+humidity = 45.0
+failing = False
+
+
+class DHT22:
+    def __init__(self, pin):
+        self.pin = pin
+
+    def measure(self):
+        if failing:
+            raise OSError(116)
+
+    def temperature(self):
+        return temperature
+
+    def humidity(self):
+        return humidity
@@ -0,0 +1,3 @@
+# CPython stand-in for the MicroPython module of the same name
+def osdebug(level):
+    pass
@@ -0,0 +1,63 @@
+# CPython stand-in for the MicroPython module of the same name, enough to
+# run boot.py and main.py off the board. RTC memory and the reset cause
+# survive deepsleep(), which raises DeepSleep instead of resetting: the
+# caller starts boot.py and main.py again for the next wake.
+#
+# Despite the directory name, these stand-ins target CPython (the tests run
+# them under pytest); they lean on CPython's time and are not tested under
+# the MicroPython unix port.
+PWRON_RESET = 1
+DEEPSLEEP_RESET = 4
+
+cause = PWRON_RESET
+rtc_memory = b''
+slept = []
+
+
+class DeepSleep(Exception):
+    pass
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+
+    def __init__(self, id, mode=-1, pull=-1):
+        self.id = id
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+
+    def feed(self):
+        pass
+
+
+class RTC:
+    def memory(self, data=None):
+        global rtc_memory
+        if data is None:
+            return rtc_memory
+        rtc_memory = bytes(data)
+
+
+def unique_id():
+    return b'\xa1\xb2\xc3\xd4\xe5\xf6'
+
+
+def reset_cause():
+    return cause
+
+
+def deepsleep(ms=0):
+    global cause
+    cause = DEEPSLEEP_RESET
+    slept.append(ms)
+    raise DeepSleep(ms)
+
+
+def reset():
+    global cause
+    cause = PWRON_RESET
+    raise DeepSleep(0)
@@ -0,0 +1,50 @@
+# CPython stand-in for the MicroPython module of the same name: one station
+# that associates when reachable is set, counting scans and connects
+STA_IF = 0
+AP_IF = 1
+
+reachable = True
+address = '10.0.0.32'
+access_points = [(b'BobsHauntedGecko', b'\x00\x11\x22\x33\x44\x55', 6, -60, 3, False)]
+scans = 0
+connects = []
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self.up = False
+        self.connected = False
+        self.static = None
+
+    def active(self, flag=None):
+        if flag is None:
+            return self.up
+        self.up = flag
+
+    def scan(self):
+        global scans
+        scans += 1
+        return access_points
+
+    def connect(self, ssid, password, bssid=None):
+        connects.append((ssid, bssid))
+        self.connected = reachable
+
+    def disconnect(self):
+        self.connected = False
+
+    def isconnected(self):
+        return self.connected
+
+    def config(self, *args, **kwargs):
+        if args == ('mac',):
+            return b'\xa1\xb2\xc3\xd4\xe5\xf7'
+
+    def ifconfig(self, config=None):
+        if config is not None:
+            self.static = config
+            return
+        if self.static:
+            return self.static
+        return (address, '255.255.255.0', '10.0.0.1', '10.0.0.1')
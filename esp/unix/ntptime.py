@@ -0,0 +1,4 @@
+# CPython stand-in for the MicroPython module of the same name; the host
+# clock is already set
+def settime():
+    pass
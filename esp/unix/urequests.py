@@ -0,0 +1,7 @@
+# CPython stand-in for the MicroPython module of the same name; nothing here
+# makes HTTP requests
+def get(url, **kwargs):
+    raise OSError('no network in the unix stand-ins')
+
+
+post = get
@@ -0,0 +1,2 @@
+# CPython stand-in for the MicroPython module of the same name
+from struct import *
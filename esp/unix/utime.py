@@ -0,0 +1,18 @@
+# CPython stand-in for the MicroPython module of the same name
+from time import *
+
+
+def ticks_ms():
+    return int(monotonic() * 1000)
+
+
+def ticks_us():
+    return int(monotonic() * 1000000)
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def sleep_ms(ms):
+    sleep(ms / 1000)
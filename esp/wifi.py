@@ -0,0 +1,52 @@
+import time
+import network
+
+import config
+
+station = network.WLAN(network.STA_IF)
+
+
+def find_ap(ssid):
+    # (bssid, channel) of the strongest access point for ssid, or (None, 0).
+    # Cached by the caller, so later connects can skip the scan.
+    best = None
+    station.active(True)
+    try:
+        for ap in station.scan():
+            if ap[0] == ssid.encode() and (best is None or ap[3] > best[3]):
+                best = ap
+    except OSError as e:
+        print(e)
+    return (best[1], best[2]) if best else (None, 0)
+
+
+def connect(ssid, password, timeout=None, bssid=None, channel=0):
+    # Block until connected, or for at most timeout seconds (None: forever).
+    # A known bssid and channel let the station associate without scanning;
+    # config.STATIC_IP skips DHCP.
+    station.active(True)
+    if station.isconnected():
+        return True
+    if config.STATIC_IP:
+        station.ifconfig(config.STATIC_IP)
+    if channel:
+        try:
+            station.config(channel=channel)
+        except (OSError, ValueError):
+            pass
+    start = time.time()
+    while True:
+        try:
+            if bssid:
+                station.connect(ssid, password, bssid=bssid)
+            else:
+                station.connect(ssid, password)
+        except OSError as e:
+            print(e)
+        for _ in range(20):
+            if station.isconnected():
+                return True
+            time.sleep_ms(100)
+        if timeout is not None and time.time() - start >= timeout:
+            return False
+        print('Trying again')
@@ -1,4 +1,4 @@
-import time, os, json
+import time, os, json, struct, array, math
 import board, busio, digitalio, displayio
 from adafruit_display_text import bitmap_label
 from adafruit_bitmap_font import bitmap_font
@@ -7,11 +7,9 @@ import adafruit_st7735r
 
 # terminalio removed (unused)
 import wifi, socketpool
-import adafruit_requests
 from adafruit_minimqtt import adafruit_minimqtt as MQTT
 
-# removed unused Sparkline import
-from adafruit_display_shapes.line import Line
+import bitmaptools
 import rtc
 
 MQTT_BROKER = "mqtt.lan"
@@ -21,12 +19,20 @@ MQTT_CTRL_TOPIC = "dht_sensor_lcd_control"
 MQTT_CONFIG_TOPIC = MQTT_CTRL_TOPIC  # reuse legacy control topic for config
 MQTT_ROTATION_TOPIC = "dht_sensor_lcd_rotation"
 MQTT_BACKLIGHT_TOPIC = "dht_sensor_lcd_backlight"
+# Chart history pushed by the web server: <prefix>/<bucket seconds>/<count>,
+# payload as GET /bucket.bin
+BUCKET_UPDATE_TOPIC = "dht_bucket_update"
 
 HOST_OUT = "10.0.0.31"  # external
 HOST_IN = "10.0.0.32"  # internal
 
 # Config: select metric 'temp' or 'hum'
 METRIC = os.getenv("METRIC") or "temp"
+# Chart series until the config topic sets one; the initial draw uses it
+BUCKET_PERIOD = "1hours"
+BUCKET_COUNT = 24
+# Count as configured, before capping to the chart width; names the series
+BUCKET_SERIES_COUNT = BUCKET_COUNT
 
 # ---- Display ----
 displayio.release_displays()
@@ -98,121 +104,312 @@ chart_h = 76  # taller single chart
 TEMP_MIN, TEMP_MAX = 10.0, 35.0
 HUM_MIN, HUM_MAX = 20.0, 100.0
 
-# Stage builder: one chart based on METRIC
-
-
-def build_staged_charts(buckets):
-    stage = displayio.Group()
-
-    # Collect metric values from buckets (IN + OUT)
-    vals = []
-    if buckets:
-        for item in buckets:
-            if METRIC == "hum" or METRIC == "humidity":
-                iv = item.get("in_humidity")
-                ov = item.get("out_humidity")
-            else:
-                iv = item.get("in_temp")
-                ov = item.get("out_temp")
-            if iv is not None:
-                vals.append(float(iv))
-            if ov is not None:
-                vals.append(float(ov))
-
-    # Determine exact bounds (no padding)
-    if vals:
-        vmin = min(vals)
-        vmax = max(vals)
-    else:
-        vmin, vmax = (
+# Chart scale: "exact" fits the data with no padding, so every new extreme
+# rescales (a full redraw); "auto" pads the range, snaps it to nice steps and
+# keeps it until the data leaves it or shrinks well inside it.
+# Config topic fields: "scale", "scale_pad", "scale_shrink"
+SCALE_MODE = os.getenv("SCALE_MODE") or "auto"
+SCALE_PAD = 0.1  # padding each side, fraction of the data span
+SCALE_SHRINK = 0.4  # rescale once the data spans less than this of the range
+SCALE_MIN_SPAN = 1.0  # smallest data span scaled for, in C or %
+
+# /bucket.bin payload (see dhtBucket.py on the server): a 16 byte header, then
+# uint16 age[n] and int16 in_temp, in_hum, out_temp, out_hum [n], newest first
+BUCKET_HEADER = "<4sBBHII"  # magic, version, scale, n, bucket seconds, open start
+BUCKET_HEADER_SIZE = 16
+BUCKET_MISSING = -32768
+# Array index of each value after the ages
+COL_IN_TEMP, COL_IN_HUM, COL_OUT_TEMP, COL_OUT_HUM = range(4)
+
+
+RING_SIZE = 160  # >= the largest BUCKET_COUNT (chart width in any rotation)
+PERIOD_UNITS = {
+    "minutes": 60,
+    "hours": 3600,
+    "days": 86400,
+    "weeks": 604800,
+    "month": 2592000,
+    "months": 2592000,
+}
+
+
+class BucketRing:
+    # Chart history merged from /bucket.bin payloads. A bucket lives in slot
+    # (bucket index % size), so merging a delta never moves data; stamp[slot]
+    # is the bucket index the slot was last written for, anything else there
+    # is stale.
+    def __init__(self, size):
+        self.size = size
+        self.stamp = array.array("l", [-1] * size)
+        self.cols = [array.array("h", [BUCKET_MISSING] * size) for _ in range(4)]
+        self.scale = 100
+        self.bucket_seconds = 0
+        self.newest = -1  # bucket index of the newest (open) bucket
+
+    def reset(self):
+        for i in range(self.size):
+            self.stamp[i] = -1
+        self.bucket_seconds = 0
+        self.newest = -1
+
+    def merge(self, buf):
+        magic, version, scale, n, bucket_seconds, open_start = struct.unpack_from(
+            BUCKET_HEADER, buf, 0
+        )
+        if magic != b"DHTB" or version != 1:
+            raise ValueError("not a v1 bucket payload")
+        if len(buf) < BUCKET_HEADER_SIZE + 10 * n:
+            raise ValueError("short bucket payload")
+        if bucket_seconds != self.bucket_seconds:
+            self.reset()
+            self.bucket_seconds = bucket_seconds
+        self.scale = scale
+        mv = memoryview(buf)
+        open_idx = open_start // bucket_seconds
+        if open_idx > self.newest:
+            self.newest = open_idx
+        oldest = -1
+        for i in range(n):
+            idx = open_idx - struct.unpack_from("<H", mv, BUCKET_HEADER_SIZE + 2 * i)[0]
+            oldest = max(oldest, self.newest - idx)
+            slot = idx % self.size
+            self.stamp[slot] = idx
+            for c in range(4):
+                off = BUCKET_HEADER_SIZE + 2 * n * (c + 1) + 2 * i
+                self.cols[c][slot] = struct.unpack_from("<h", mv, off)[0]
+        # Age of the oldest bucket written, for Chart.render
+        return oldest
+
+    def value(self, col, age):
+        # Value `age` buckets before the newest, None if missing or unknown
+        idx = self.newest - age
+        slot = idx % self.size
+        if self.newest < 0 or self.stamp[slot] != idx:
+            return None
+        v = self.cols[col][slot]
+        return None if v == BUCKET_MISSING else v / self.scale
+
+
+ring = BucketRing(RING_SIZE)
+
+
+def metric_cols():
+    if METRIC in ("hum", "humidity"):
+        return COL_IN_HUM, COL_OUT_HUM
+    return COL_IN_TEMP, COL_OUT_TEMP
+
+
+def period_seconds(period):
+    # Same "<number><unit>" rules as the server's /bucket
+    i = 0
+    while i < len(period) and period[i].isdigit():
+        i += 1
+    return int(period[:i] or "1") * PERIOD_UNITS.get(period[i:] or "minutes", 60)
+
+
+def bucket_topic():
+    # The server publishes one series per (bucket seconds, count), capped to
+    # what the ring holds
+    count = max(1, min(BUCKET_SERIES_COUNT, RING_SIZE))
+    return f"{BUCKET_UPDATE_TOPIC}/{period_seconds(BUCKET_PERIOD)}/{count}"
+
+
+bucket_sub = None
+
+
+def subscribe_buckets():
+    # (Re)subscribe to the series for the current config. The retained
+    # message is the full chart, so a fresh ring is filled at once.
+    global bucket_sub
+    topic = bucket_topic()
+    if mqtt is None or topic == bucket_sub:
+        return
+    if bucket_sub is not None:
+        try:
+            mqtt.unsubscribe(bucket_sub)
+        except Exception as e:
+            print("MQTT unsubscribe failed:", e)
+    ring.reset()
+    mqtt.subscribe(topic)
+    bucket_sub = topic
+    print("MQTT subscribed:", topic)
+
+
+def value_range(buckets, n, in_col, out_col, prev=None):
+    # Chart bounds for the shown values; prev is the range on screen
+    vmin = vmax = None
+    for age in range(n):
+        for col in (in_col, out_col):
+            v = buckets.value(col, age)
+            if v is None:
+                continue
+            if vmin is None or v < vmin:
+                vmin = v
+            if vmax is None or v > vmax:
+                vmax = v
+    if vmin is None:
+        if prev is not None:
+            return prev
+        return (
             (HUM_MIN, HUM_MAX)
             if METRIC in ("hum", "humidity")
             else (TEMP_MIN, TEMP_MAX)
         )
-
+    if SCALE_MODE == "auto":
+        return autoscale(prev, vmin, vmax)
     if (vmax - vmin) < 1e-6:
         vmax = vmin + 1.0
-
-    mid = (vmin + vmax) / 2.0
-
-    # Manual polyline rendering replaces Sparkline; collect points then draw segments
-    in_coords = []
-    out_coords = []
-
-    # Axis ticks and labels (top/mid/bottom) with one-decimal values
-    axis = (
-        (chart_y, f"{vmax:.1f}"),
-        (chart_y + chart_h // 2, f"{mid:.1f}"),
-        (chart_y + chart_h - 1, f"{vmin:.1f}"),
-    )
-    for y, text in axis:
-        stage.append(Line(chart_x - 2, y, chart_x + chart_width, y, AXIS_COLOR))
-        lbl = bitmap_label.Label(font, text=text, color=AXIS_COLOR, scale=1)
-        lbl.x = 0
-        lbl.y = y
-        stage.append(lbl)
-    # Right-edge subtle tick to indicate newest side
-    rx = chart_x + chart_width - 1
-    ry1 = chart_y + chart_h // 2 - 4
-    ry2 = chart_y + chart_h // 2 + 4
-    stage.append(Line(rx, ry1, rx, ry2, AXIS_COLOR))
-    # Subtle bottom baseline cue
-    stage.append(
-        Line(
-            chart_x,
-            chart_y + chart_h - 1,
-            chart_x + chart_width,
-            chart_y + chart_h - 1,
-            AXIS_COLOR,
+    return vmin, vmax
+
+
+def nice_step(x):
+    # Smallest 1, 2 or 5 x 10^k >= x
+    base = 10 ** math.floor(math.log10(x))
+    for m in (1, 2, 5, 10):
+        if m * base >= x:
+            return m * base
+    return 10 * base
+
+
+def autoscale(prev, dmin, dmax):
+    # SCALE_MODE "auto": keep prev while the data fits and fills enough of it
+    span = max(dmax - dmin, SCALE_MIN_SPAN)
+    if prev is not None:
+        lo, hi = prev
+        if lo <= dmin and dmax <= hi and span >= SCALE_SHRINK * (hi - lo):
+            return prev
+    pad = span * SCALE_PAD
+    # Bounds on multiples of a nice step, about five steps across
+    step = nice_step((span + 2 * pad) / 5)
+    lo = math.floor((dmin - pad) / step) * step
+    hi = math.ceil((dmax + pad) / step) * step
+    return lo, hi
+
+
+# Chart palette indexes
+PX_BG, PX_AXIS, PX_OUT, PX_IN = range(4)
+
+
+class Chart:
+    # Both series drawn into one preallocated bitmap, newest bucket at the
+    # right edge and `step` pixels per bucket. When buckets are appended the
+    # pixels shift left and only the tail that changed is redrawn; the whole
+    # chart is redrawn only when the scale or layout changes, and the axis
+    # labels only change with the scale.
+    def __init__(self):
+        self.palette = displayio.Palette(4)
+        self.palette[PX_BG] = 0x000000
+        self.palette[PX_AXIS] = AXIS_COLOR
+        self.palette[PX_OUT] = OUT_COLOR
+        self.palette[PX_IN] = IN_COLOR
+        self.bitmap = None
+        self.grid = None
+        self.labels = []
+        for _ in range(3):
+            lbl = bitmap_label.Label(font, text="", color=AXIS_COLOR, scale=1)
+            lbl.x = 0
+            self.labels.append(lbl)
+        self.layout()
+
+    def layout(self):
+        # (Re)allocate for the current chart_* dimensions, e.g. after rotation
+        while len(charts_group):
+            charts_group.pop()
+        self.width = chart_width
+        self.height = chart_h
+        self.bitmap = displayio.Bitmap(self.width, self.height, len(self.palette))
+        self.grid = displayio.TileGrid(
+            self.bitmap, pixel_shader=self.palette, x=chart_x, y=chart_y
         )
-    )
-
-    # Plot buckets newest-on-right (API assumed newest-first; reverse for left→right chronological)
-    if buckets:
-        ordered = list(reversed(buckets))  # oldest first, newest last
-        raw_in = []
-        raw_out = []
-        for item in ordered:
-            if METRIC in ("hum", "humidity"):
-                iv = item.get("in_humidity")
-                ov = item.get("out_humidity")
-            else:
-                iv = item.get("in_temp")
-                ov = item.get("out_temp")
-            if (iv is None) or (ov is None):
-                continue
-            raw_in.append(norm(float(iv), vmin, vmax, chart_h))
-            raw_out.append(norm(float(ov), vmin, vmax, chart_h))
-        ln = min(len(raw_in), len(raw_out))
-        if ln > 1:
-            for i in range(ln):
-                x = chart_x + int(i * (chart_width - 1) / (ln - 1))
-                in_coords.append((x, chart_y + raw_in[i]))
-                out_coords.append((x, chart_y + raw_out[i]))
-        elif ln == 1:
-            x = chart_x + (chart_width // 2)
-            in_coords.append((x, chart_y + raw_in[0]))
-            out_coords.append((x, chart_y + raw_out[0]))
-        # Draw OUT then IN
-        for i in range(1, len(out_coords)):
-            x1, y1 = out_coords[i - 1]
-            x2, y2 = out_coords[i]
-            stage.append(Line(x1, y1, x2, y2, OUT_COLOR))
-        for i in range(1, len(in_coords)):
-            x1, y1 = in_coords[i - 1]
-            x2, y2 = in_coords[i]
-            stage.append(Line(x1, y1, x2, y2, IN_COLOR))
-    return stage
-
-
-def swap_charts(new_group):
-    global charts_group
-    try:
-        group.remove(charts_group)
-    except Exception:
-        pass
-    charts_group = new_group
-    group.append(charts_group)
+        charts_group.append(self.grid)
+        # Top, middle and bottom gridlines, labelled with max/mid/min
+        self.rows = (0, self.height // 2, self.height - 1)
+        for lbl, y in zip(self.labels, self.rows):
+            lbl.y = chart_y + y
+            charts_group.append(lbl)
+        self.key = None
+        self.newest = -1
+
+    def x(self, age):
+        return self.width - 1 - age * self.step
+
+    def render(self, buckets, dirty=None):
+        # dirty: oldest age the last ring.merge() wrote, None for everything
+        n = BUCKET_COUNT
+        in_col, out_col = metric_cols()
+        prev = None
+        if self.key is not None and self.key[2:] == (n, in_col):
+            prev = self.key[:2]
+        vmin, vmax = value_range(buckets, n, in_col, out_col, prev)
+        self.step = max(1, (self.width - 1) // max(1, n - 1))
+        # Oldest bucket that fits on the chart
+        self.last = min(n - 1, (self.width - 1) // self.step)
+        key = (vmin, vmax, n, in_col)
+        shift = buckets.newest - self.newest
+        if dirty is None or key != self.key or shift < 0 or shift >= n:
+            self.key = key
+            self.newest = buckets.newest
+            self.set_labels(vmin, vmax)
+            self.draw_from(buckets, n - 1)
+            return
+        if shift:
+            px = shift * self.step
+            # Copies forward through each row, so the overlap is safe
+            bitmaptools.blit(
+                self.bitmap, self.bitmap, 0, 0, x1=px, y1=0, x2=self.width, y2=self.height
+            )
+            # Clear what shifted past the oldest bucket shown, including its
+            # column where the segment from the next older one ended
+            left = self.x(self.last) + 1
+            bitmaptools.fill_region(self.bitmap, 0, 0, left, self.height, PX_BG)
+            for y in self.rows:
+                bitmaptools.draw_line(self.bitmap, 0, y, left - 1, y, PX_AXIS)
+            self.draw_series(buckets, self.last, self.last - 1)
+            self.newest = buckets.newest
+        self.draw_from(buckets, max(dirty, shift - 1))
+
+    def set_labels(self, vmin, vmax):
+        for lbl, v in zip(self.labels, (vmax, (vmin + vmax) / 2.0, vmin)):
+            text = f"{v:.1f}"
+            if lbl.text != text:
+                lbl.text = text
+
+    def draw_from(self, buckets, d):
+        # Redraw buckets aged <= d: clear from the column of bucket d + 1
+        # (segments into d start there) and redraw from bucket d + 2 on
+        x0 = 0 if d >= self.last else self.x(d + 1)
+        bm = self.bitmap
+        bitmaptools.fill_region(bm, x0, 0, self.width, self.height, PX_BG)
+        for y in self.rows:
+            bitmaptools.draw_line(bm, x0, y, self.width - 1, y, PX_AXIS)
+        # Right-edge tick marks the newest side
+        mid = self.height // 2
+        bitmaptools.draw_line(bm, self.width - 1, mid - 4, self.width - 1, mid + 4, PX_AXIS)
+        self.draw_series(buckets, min(d + 2, self.last), 0)
+
+    def draw_series(self, buckets, oldest, newest):
+        # Segments between buckets aged oldest..newest. IN is drawn after OUT
+        # so it wins where they cross, and one segment wider on each side so
+        # OUT redrawn here never covers IN from a neighbouring segment.
+        vmin, vmax = self.key[0], self.key[1]
+        bm = self.bitmap
+        in_col, out_col = metric_cols()
+        spans = (
+            (out_col, PX_OUT, oldest, newest),
+            (in_col, PX_IN, min(oldest + 1, self.last), max(newest - 1, 0)),
+        )
+        for col, px, first, end in spans:
+            prev = None
+            for age in range(first, end - 1, -1):
+                v = buckets.value(col, age)
+                x = self.x(age)
+                if v is None:
+                    prev = None
+                    continue
+                y = norm(v, vmin, vmax, self.height)
+                if prev is not None:
+                    bitmaptools.draw_line(bm, prev[0], prev[1], x, y, px)
+                prev = (x, y)
 
 
 # Normalize helper
@@ -448,16 +645,13 @@ def connect_wifi():
 
 
 pool = None
-session = None
 
 
 def ensure_wifi():
-    global pool, session
+    global pool
     try:
         if not pool:
             pool = connect_wifi()
-            # Build HTTP session for bucket fetches (http, no SSL)
-            session = adafruit_requests.Session(pool, None)
     except Exception as e:
         print("WiFi connect failed:", e)
         time.sleep(2)
@@ -466,8 +660,24 @@ def ensure_wifi():
 mqtt = None
 
 
+def apply_scale_config(cfg):
+    # Optional chart scale fields of the config topic
+    global SCALE_MODE, SCALE_PAD, SCALE_SHRINK
+    mode = cfg.get("scale")
+    if mode in ("auto", "exact"):
+        SCALE_MODE = mode
+    pad = cfg.get("scale_pad")
+    if isinstance(pad, (int, float)) and 0 <= pad <= 1:
+        SCALE_PAD = float(pad)
+    shrink = cfg.get("scale_shrink")
+    if isinstance(shrink, (int, float)) and 0 <= shrink < 1:
+        SCALE_SHRINK = float(shrink)
+    # Recompute from scratch rather than keep a range from the old settings
+    chart.key = None
+
+
 def handle_message(client, topic, msg):
-    global METRIC, BUCKET_PERIOD, BUCKET_COUNT, last_bucket_fetch, last_age_refresh, chart_width, chart_x, chart_y, chart_h
+    global METRIC, BUCKET_PERIOD, BUCKET_COUNT, BUCKET_SERIES_COUNT, last_age_refresh, chart_width, chart_x, chart_y, chart_h
     # Basic diagnostics
     # try:
     #    print("MQTT msg:", topic, "len=", len(msg) if msg else 0)
@@ -489,6 +699,7 @@ def handle_message(client, topic, msg):
         m = cfg.get("metric")
         p = cfg.get("period")
         c = cfg.get("count")
+        apply_scale_config(cfg)
 
         if m in ("temp", "hum", "humidity"):
             METRIC = "temp" if m == "temp" else "hum"
@@ -515,26 +726,25 @@ def handle_message(client, topic, msg):
         if isinstance(c, int):
             max_items = chart_width
             BUCKET_COUNT = max(1, min(c, max_items))
+            BUCKET_SERIES_COUNT = c
         print("CONFIG applied:", METRIC, BUCKET_PERIOD, BUCKET_COUNT)
-        # Immediate clear and fetch
+        last_age_refresh = time.monotonic()
         try:
-            empty_stage = build_staged_charts([])
-            swap_charts(empty_stage)
+            # A new series resets the ring and clears the chart until its
+            # retained message arrives; same series: redraw the new metric
+            subscribe_buckets()
+            chart.render(ring)
         except Exception as e:
-            print("CONFIG clear failed:", e)
-        last_age_refresh = time.monotonic()
+            print("CONFIG subscribe failed:", e)
+        return
+    # Chart history from the server
+    if topic.startswith(BUCKET_UPDATE_TOPIC + "/"):
+        if topic != bucket_sub:
+            return  # left over from the previous config
         try:
-            if session:
-                resp = session.get(
-                    BUCKET_URL.format(period=BUCKET_PERIOD, count=BUCKET_COUNT)
-                )
-                data = resp.json()
-                resp.close()
-                stage = build_staged_charts(data)
-                swap_charts(stage)
-                last_bucket_fetch = time.monotonic()
+            chart.render(ring, ring.merge(msg))
         except Exception as e:
-            print("CONFIG fetch failed:", e)
+            print("Bucket update failed:", e)
         return
     # Rotation topic handling
     if topic == MQTT_ROTATION_TOPIC:
@@ -559,18 +769,9 @@ def handle_message(client, topic, msg):
                         if (display.height - chart_y - 8) > 10
                         else chart_h
                     )
-                    empty_stage = build_staged_charts([])
-                    swap_charts(empty_stage)
-                    # Optional fresh bucket fetch
-                    if session:
-                        resp = session.get(
-                            BUCKET_URL.format(period=BUCKET_PERIOD, count=BUCKET_COUNT)
-                        )
-                        data = resp.json()
-                        resp.close()
-                        stage = build_staged_charts(data)
-                        swap_charts(stage)
-                        last_bucket_fetch = time.monotonic()
+                    # Redraw from the ring; the history has not changed
+                    chart.layout()
+                    chart.render(ring)
                 # rotation applied (quiet)
             except Exception as e:
                 print("ROTATION apply failed:", e)
@@ -617,14 +818,21 @@ def handle_message(client, topic, msg):
         return
 
     host = data.get("host")
-    temp = data.get("temp")
-    hum = data.get("hum")
+    # A batch of buffered readings (oldest first): show the newest
+    batch = data.get("batch")
+    reading = batch[-1] if batch else data
+    temp = reading.get("temp")
+    hum = reading.get("hum")
 
     if host is None:
         print("SENSOR missing host; ignoring")
         return
 
     ts = time.time()
+    # Age from when it was measured, unless the node's clock looks unsynced
+    sent = reading.get("ts")
+    if isinstance(sent, (int, float)) and ts - 86400 < sent <= ts:
+        ts = sent
     if host == HOST_OUT:
         if temp is not None:
             last_out["temp"] = float(temp)
@@ -647,7 +855,7 @@ def handle_message(client, topic, msg):
 
 
 def ensure_mqtt():
-    global mqtt
+    global mqtt, bucket_sub
     if not pool:
         return
     if mqtt is None:
@@ -657,6 +865,8 @@ def ensure_mqtt():
                 port=MQTT_PORT,
                 socket_pool=pool,
                 keep_alive=60,
+                # Bucket updates are binary; JSON handlers take bytes too
+                use_binary_mode=True,
             )
             mqtt.on_message = handle_message
             mqtt.connect()
@@ -666,6 +876,8 @@ def ensure_mqtt():
                 mqtt.subscribe(MQTT_CONFIG_TOPIC)
             mqtt.subscribe(MQTT_ROTATION_TOPIC)
             mqtt.subscribe(MQTT_BACKLIGHT_TOPIC)
+            bucket_sub = None
+            subscribe_buckets()
             print(
                 "MQTT connected/subscribed:",
                 MQTT_TOPIC,
@@ -679,6 +891,8 @@ def ensure_mqtt():
 
 
 # Initial draw
+chart = Chart()
+chart.render(ring)
 update_ui()
 # Initial clock draw
 manage_backlight()
@@ -695,26 +909,7 @@ except Exception as e:
     print("NTP failed:", e)
 
 last_age_refresh = time.monotonic()
-last_bucket_fetch = 0
 last_clock_min = -1
-BUCKET_PERIOD = "1hours"
-BUCKET_COUNT = 24
-BUCKET_URL = "http://rpi5.lan:8071/bucket/{period}/{count}"
-
-# Initial live bucket fetch
-try:
-    ensure_wifi()
-    if session:
-        url = BUCKET_URL.format(period=BUCKET_PERIOD, count=BUCKET_COUNT)
-        print("FETCH URL:", url)
-        resp = session.get(url)
-        data = resp.json()
-        resp.close()
-        stage = build_staged_charts(data)
-        swap_charts(stage)
-        last_bucket_fetch = time.monotonic()
-except Exception as e:
-    print("Bucket fetch failed:", e)
 
 # Main loop
 while True:
@@ -746,18 +941,4 @@ while True:
     except Exception:
         pass
 
-    # bucket fetch every 15 minutes
-    if (session is not None) and (time.monotonic() - last_bucket_fetch > 900):
-        try:
-            resp = session.get(
-                BUCKET_URL.format(period=BUCKET_PERIOD, count=BUCKET_COUNT)
-            )
-            data = resp.json()
-            resp.close()
-            stage = build_staged_charts(data)
-            swap_charts(stage)
-            last_bucket_fetch = time.monotonic()
-        except Exception as e:
-            print("Bucket fetch failed:", e)
-
     time.sleep(0.1)
@@ -0,0 +1 @@
+../common/dhtAggregate.py
\ No newline at end of file
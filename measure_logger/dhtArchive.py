@@ -0,0 +1 @@
+../common/dhtArchive.py
\ No newline at end of file
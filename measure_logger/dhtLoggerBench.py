@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import dhtPayload
+import dhtStorage
+import dhtPartitions
+
+# Replays a burst of synthetic measurement messages through the logger's
+# decode path into a scratch SQLite file, two ways:
+#   per-row  one transaction per reading in a rollback journal database with
+#            the default synchronous, as the logger used to write
+#   batched  SqliteStore.append_batch of DHT_BATCH_ROWS readings at a time,
+#            WAL with synchronous=normal, as the writer thread does now
+# and prints inserts/s for each.
+
+
+def messages(n, now=None):
+    # n single-reading JSON payloads from two nodes, one a second up to now
+    if now is None:
+        now = int(time.time())
+    out = []
+    for i in range(n):
+        h = i % 2
+        out.append(json.dumps({
+            "host": f"10.0.0.3{h + 1}",
+            "client_id": f"bench{h}",
+            "sensor": 14,
+            "temp": 15 + 10 * h + (i % 600) / 100,
+            "hum": 40 + (i % 300) / 10,
+            "ts": now - n + i,
+        }).encode())
+    return out
+
+
+def rows_of(payload):
+    d = dhtPayload.decode("dht_sensor_measurement", payload)
+    return [(r["host"], r["sensor"], r["client_id"], r["temp"], r["hum"], r["ts"]) for r in dhtPayload.readings(d)]
+
+
+def per_row(path, payloads):
+    con = dhtPartitions.open_db(path, "delete", "full")
+    for payload in payloads:
+        for row in rows_of(payload):
+            with con:
+                con.execute(dhtStorage.SqliteStore.INSERT_SQL, row[:5] + (dhtStorage.ts_text(row[5]),))
+    con.close()
+
+
+def batched(path, payloads, batch_rows):
+    store = dhtStorage.SqliteStore(path)
+    store.open()
+    batch = []
+    for payload in payloads:
+        batch.extend(rows_of(payload))
+        if len(batch) >= batch_rows:
+            store.append_batch(batch)
+            batch = []
+    if batch:
+        store.append_batch(batch)
+    store.close()
+
+
+def count(path):
+    con = dhtPartitions.open_db(path)
+    n = con.execute("select count(*) from dht").fetchone()[0]
+    con.close()
+    return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Logger insert throughput for a burst of messages")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--batch-rows", type=int, default=int(os.environ.get("DHT_BATCH_ROWS", "500")))
+    parser.add_argument("--dir", help="where to put the scratch databases (same disk as DHT_DB for real numbers)")
+    parser.add_argument("--skip-per-row", action="store_true", help="the per-row path takes minutes on slow disks")
+    args = parser.parse_args(argv)
+
+    payloads = messages(args.messages)
+    with tempfile.TemporaryDirectory(prefix="dhtloggerbench", dir=args.dir) as scratch:
+        runs = [("batched", lambda path: batched(path, payloads, args.batch_rows))]
+        if not args.skip_per_row:
+            runs.insert(0, ("per-row", lambda path: per_row(path, payloads)))
+        for label, run in runs:
+            path = os.path.join(scratch, f"{label}.db")
+            t = time.perf_counter()
+            run(path)
+            elapsed = time.perf_counter() - t
+            n = count(path)
+            print(f"{label}: {n} rows in {elapsed:.1f} s, {n / elapsed:.0f} inserts/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
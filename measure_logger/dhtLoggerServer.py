@@ -1,47 +1,122 @@
-import json
-import sqlite3
+import os
+import sys
+import queue
+import signal
+import threading
 import time
-from datetime import datetime
 import paho.mqtt.client as mqtt
 
-while True:
-    try:
-        con = sqlite3.connect("/home/andre/dhtHost/db/dht.db")
+import dhtPayload
+import dhtStorage
 
-        with con:
-            con.execute("create table if not exists dht (id integer primary key, host text, sensor integer, client_id text, temp real, hum real, ts timestamp default current_timestamp)")
+# Storage backend, see dhtStorage.store_from_config. Defaults to SQLite:
+#   DHT_STORAGE=single: one ever-growing DHT_DB file
+#   DHT_STORAGE=monthly: one dht-YYYY-MM.db per month in DHT_DB_DIR, keeping
+#     DHT_RETENTION_MONTHS (0 keeps everything); expired months are moved to
+#     DHT_ARCHIVE_DIR if set, otherwise deleted
+store = dhtStorage.store_from_config(os.environ.get)
 
-        with con:
-            con.execute("create index if not exists dht_host on dht (host)")
+# Flush after this many rows or this many ms after the first queued row
+BATCH_ROWS = int(os.environ.get("DHT_BATCH_ROWS", "500"))
+BATCH_MS = int(os.environ.get("DHT_BATCH_MS", "1000"))
 
-        # The callback for when the client receives a CONNACK response from the server.
+# Lives outside the restart loop so readings queued before a restart are kept
+pending = queue.Queue()
+stopping = threading.Event()
 
-        def on_connect(client, userdata, flags, rc):
-            print("Connected with result code "+str(rc))
 
-            # Subscribing in on_connect() means that if we lose the connection and
-            # reconnect then subscriptions will be renewed.
-            client.subscribe("dht_sensor_measurement")
+def next_batch():
+    # Block for the first row, then collect until BATCH_ROWS or BATCH_MS
+    batch = []
+    while not batch:
+        try:
+            batch.append(pending.get(timeout=0.5))
+        except queue.Empty:
+            if stopping.is_set():
+                return batch
+    deadline = time.monotonic() + BATCH_MS / 1000
+    while len(batch) < BATCH_ROWS:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(pending.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return batch
 
-        # The callback for when a PUBLISH message is received from the server.
 
-        def on_message(client, userdata, msg):
-            # print(msg.topic);
-            d = json.loads(msg.payload)
-            print(d)
-            with con:
-                con.execute("insert into dht (host, sensor, client_id, temp, hum) values (?, ?, ?, ?, ?)", (d['host'], d['sensor'], d['client_id'], d['temp'], d['hum']))
+def writer():
+    batch = []
+    while True:
+        if not batch:
+            batch = next_batch()
+        if not batch:
+            if stopping.is_set() and pending.empty():
+                break
+            continue
+        try:
+            # Whatever was not written is retried once the db is reopened
+            batch = store.append_batch(batch)
+        except Exception as e:
+            print("Write failed:", e)
+        if batch:
+            if stopping.is_set():
+                print(f"Dropping {len(batch) + pending.qsize()} rows on shutdown")
+                break
+            time.sleep(3)
+    store.close()
 
-        client = mqtt.Client()
-        client.on_connect = on_connect
-        client.on_message = on_message
 
-        client.connect("mqtt.lan", 1883, 60)
+def shutdown(signum, frame):
+    sys.exit(0)
 
-        # Blocking call that processes network traffic, dispatches callbacks and handles reconnecting.
-        # Other loop*() functions are available that give a threaded interface and a manual interface.
-        client.loop_forever()
-    except Exception as e:
-        print(e)
-        print("Restarting in 3 seconds")
-        time.sleep(3)
+
+signal.signal(signal.SIGTERM, shutdown)
+
+store.open()
+
+writer_thread = threading.Thread(target=writer, name="dht_writer")
+writer_thread.start()
+
+try:
+    while True:
+        try:
+            # The callback for when the client receives a CONNACK response from the server.
+
+            def on_connect(client, userdata, flags, rc):
+                print("Connected with result code "+str(rc))
+
+                # Subscribing in on_connect() means that if we lose the connection and
+                # reconnect then subscriptions will be renewed.
+                client.subscribe("dht_sensor_measurement")
+                client.subscribe(dhtPayload.BIN_TOPIC)
+
+            # The callback for when a PUBLISH message is received from the server.
+
+            def on_message(client, userdata, msg):
+                # print(msg.topic);
+                d = dhtPayload.decode(msg.topic, msg.payload)
+                print(d)
+                # Stamped with the node's measurement time when it sent one
+                # (buffered batches), else on arrival so batching doesn't shift ts
+                for r in dhtPayload.readings(d):
+                    pending.put((r['host'], r['sensor'], r['client_id'], r['temp'], r['hum'], r['ts']))
+
+            client = mqtt.Client()
+            client.on_connect = on_connect
+            client.on_message = on_message
+
+            client.connect("mqtt.lan", 1883, 60)
+
+            # Blocking call that processes network traffic, dispatches callbacks and handles reconnecting.
+            # Other loop*() functions are available that give a threaded interface and a manual interface.
+            client.loop_forever()
+        except Exception as e:
+            print(e)
+            print("Restarting in 3 seconds")
+            time.sleep(3)
+finally:
+    # Flush whatever is still queued before exiting
+    stopping.set()
+    writer_thread.join()
@@ -0,0 +1 @@
+../common/dhtPayload.py
\ No newline at end of file
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The server modules import each other as top-level scripts; web_server/
+# also links in the shared modules from common/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "web_server"))
@@ -0,0 +1,125 @@
+import sys
+import types
+
+# Just enough of CircuitPython to run lcdPico1.8/code.py on a PC. Bitmaps
+# keep real pixels and bitmaptools really draws into them, so charts can be
+# compared pixel for pixel; the hardware is a sink that accepts anything.
+
+
+class Anything:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return Anything()
+
+    def __getattr__(self, name):
+        return Anything()
+
+
+class Bitmap:
+    def __init__(self, width, height, colors):
+        self.width = width
+        self.height = height
+        self.px = [[0] * width for _ in range(height)]
+
+    def fill(self, v):
+        for row in self.px:
+            row[:] = [v] * self.width
+
+
+class Palette(list):
+    def __init__(self, n):
+        super().__init__([0] * n)
+
+
+class Group(list):
+    pass
+
+
+class TileGrid:
+    def __init__(self, bitmap, pixel_shader=None, x=0, y=0):
+        self.bitmap = bitmap
+
+
+class Display:
+    def __init__(self, bus, width, height, rotation=0, **kwargs):
+        self.width = width
+        self.height = height
+        self.rotation = rotation
+        self.root_group = None
+
+
+class Label:
+    def __init__(self, font, text="", **kwargs):
+        self.text = text
+
+
+def draw_line(bm, x1, y1, x2, y2, v):
+    dx, dy = abs(x2 - x1), -abs(y2 - y1)
+    sx, sy = (1 if x1 < x2 else -1), (1 if y1 < y2 else -1)
+    err = dx + dy
+    while True:
+        bm.px[y1][x1] = v
+        if x1 == x2 and y1 == y2:
+            break
+        e2 = 2 * err
+        if e2 >= dy:
+            err += dy
+            x1 += sx
+        if e2 <= dx:
+            err += dx
+            y1 += sy
+
+
+def fill_region(bm, x1, y1, x2, y2, v):
+    for y in range(y1, y2):
+        for x in range(x1, x2):
+            bm.px[y][x] = v
+
+
+def blit(dest, src, x, y, x1=0, y1=0, x2=None, y2=None):
+    for yy in range(y1, y2):
+        for xx in range(x1, x2):
+            dest.px[y + yy - y1][x + xx - x1] = src.px[yy][xx]
+
+
+def modules():
+    # name -> module, for sys.modules
+    displayio = types.SimpleNamespace(
+        Bitmap=Bitmap, Palette=Palette, Group=Group, TileGrid=TileGrid,
+        release_displays=lambda: None,
+    )
+    mods = {
+        "board": Anything(),
+        "busio": Anything(),
+        "digitalio": Anything(),
+        "displayio": displayio,
+        "fourwire": types.SimpleNamespace(FourWire=Anything),
+        "adafruit_st7735r": types.SimpleNamespace(ST7735R=Display),
+        "adafruit_display_text": types.SimpleNamespace(bitmap_label=types.SimpleNamespace(Label=Label)),
+        "adafruit_display_text.bitmap_label": types.SimpleNamespace(Label=Label),
+        "adafruit_bitmap_font": types.SimpleNamespace(bitmap_font=Anything()),
+        "adafruit_bitmap_font.bitmap_font": Anything(),
+        "wifi": Anything(),
+        "socketpool": Anything(),
+        "adafruit_minimqtt": types.SimpleNamespace(adafruit_minimqtt=Anything()),
+        "adafruit_minimqtt.adafruit_minimqtt": Anything(),
+        "bitmaptools": types.SimpleNamespace(draw_line=draw_line, fill_region=fill_region, blit=blit),
+        "rtc": Anything(),
+    }
+    return {name: (m if isinstance(m, types.ModuleType) else _module(name, m)) for name, m in mods.items()}
+
+
+def _module(name, obj):
+    mod = types.ModuleType(name)
+    if isinstance(obj, Anything):
+        mod.__getattr__ = lambda attr: Anything()
+    else:
+        mod.__dict__.update(vars(obj))
+    return mod
+
+
+def install(monkeypatch):
+    for name, mod in modules().items():
+        monkeypatch.setitem(sys.modules, name, mod)
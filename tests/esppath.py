@@ -0,0 +1,10 @@
+import os
+import sys
+
+# esp/ runs on MicroPython; esp/unix/ has CPython stand-ins for the
+# MicroPython modules it imports. The tests run the node code under CPython,
+# not the MicroPython unix port.
+ESP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "esp")
+for path in (ESP, os.path.join(ESP, "unix")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,166 @@
+import socket
+import struct
+import threading
+import time
+import types
+
+# A small MQTT 3.1.1 broker stand-in for testing esp/umqttsimple.py, plus a
+# MicroPython-like socket module to point the client at it.
+
+
+class StreamSocket:
+    # MicroPython stream socket API (read/write/readinto) over a CPython one
+    def __init__(self, *args):
+        self.s = socket.socket()
+        self.writes = 0
+
+    def connect(self, addr):
+        self.s.connect(addr)
+
+    def setblocking(self, flag):
+        self.s.setblocking(flag)
+
+    def write(self, buf, n=None):
+        self.writes += 1
+        if isinstance(buf, str):
+            buf = buf.encode()
+        data = bytes(buf)[:n] if n is not None else bytes(buf)
+        self.s.sendall(data)
+        return len(data)
+
+    def read(self, n):
+        out = b""
+        while len(out) < n:
+            try:
+                chunk = self.s.recv(n - len(out))
+            except BlockingIOError:
+                if not out:
+                    return None
+                continue
+            if not chunk:
+                break
+            out += chunk
+        return out
+
+    def readinto(self, buf):
+        try:
+            return self.s.recv_into(buf)
+        except BlockingIOError:
+            return None
+
+    def close(self):
+        self.s.close()
+
+
+def socket_module(port):
+    # Stands in for usocket; every host resolves to the broker
+    return types.SimpleNamespace(
+        socket=StreamSocket,
+        getaddrinfo=lambda host, p: [(0, 0, 0, "", ("127.0.0.1", port))],
+    )
+
+
+def remaining_length(n):
+    out = b""
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        out += bytes([b | (0x80 if n else 0)])
+        if not n:
+            return out
+
+
+def publish_packet(topic, msg, qos=0, pid=1):
+    var = struct.pack("!H", len(topic)) + topic + (struct.pack("!H", pid) if qos else b"")
+    return bytes([0x30 | qos << 1]) + remaining_length(len(var) + len(msg)) + var + msg
+
+
+class Broker(threading.Thread):
+    # Accepts connections one after another. Answers CONNECT, SUBSCRIBE and
+    # QoS 1 PUBLISH; records every PUBLISH as (topic, msg, qos, dup, pid).
+    # drop_acks PUBACKs are withheld first, ack_delay slows the others, and
+    # the first hangups QoS 1 publishes get the connection closed instead.
+    def __init__(self, drop_acks=0, ack_delay=0, hangups=0):
+        super().__init__(daemon=True)
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.published = []
+        self.puback_from_client = []
+        self.drop_acks = drop_acks
+        self.ack_delay = ack_delay
+        self.hangups = hangups
+        self.conn = None
+        self.connects = 0
+        self.start()
+
+    def _recv(self, n):
+        out = b""
+        while len(out) < n:
+            chunk = self.conn.recv(n - len(out))
+            if not chunk:
+                raise EOFError
+            out += chunk
+        return out
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.conn = conn
+            try:
+                self.serve()
+            except (EOFError, OSError):
+                pass
+            conn.close()
+
+    def serve(self):
+        while True:
+            header = self._recv(1)[0]
+            n, shift = 0, 0
+            while True:
+                b = self._recv(1)[0]
+                n |= (b & 0x7F) << shift
+                shift += 7
+                if not b & 0x80:
+                    break
+            body = self._recv(n)
+            kind = header & 0xF0
+            if kind == 0x10:
+                self.connects += 1
+                self.conn.sendall(b"\x20\x02\x00\x00")
+            elif kind == 0x80:
+                self.conn.sendall(b"\x90\x03" + body[:2] + b"\x00")
+            elif kind == 0x40:
+                self.puback_from_client.append(struct.unpack("!H", body)[0])
+            elif kind == 0x30:
+                tlen = struct.unpack_from("!H", body)[0]
+                pos, pid = 2 + tlen, None
+                if header & 6:
+                    pid = struct.unpack_from("!H", body, pos)[0]
+                    pos += 2
+                self.published.append((body[2:2 + tlen], body[pos:], (header >> 1) & 3, bool(header & 8), pid))
+                if pid is not None:
+                    if self.hangups:
+                        self.hangups -= 1
+                        return
+                    if self.drop_acks:
+                        self.drop_acks -= 1
+                        continue
+                    if self.ack_delay:
+                        time.sleep(self.ack_delay)
+                    self.conn.sendall(b"\x40\x02" + struct.pack("!H", pid))
+            elif kind == 0xE0:
+                return
+
+    def send(self, data):
+        self.conn.sendall(data)
+
+    def close(self):
+        self.listener.close()
+        if self.conn is not None:
+            self.conn.close()
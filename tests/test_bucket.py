@@ -0,0 +1,33 @@
+import dhtBucket
+
+COLUMNS = {"dht": "ts", "dht_rollup_1h": "bucket_start"}
+
+
+def scan(node, relation, cond=None, plans=()):
+    plan = {"Node Type": node, "Relation Name": relation, "Plans": list(plans)}
+    if cond:
+        plan["Index Cond"] = cond
+    return {"Node Type": "Aggregate", "Plans": [plan]}
+
+
+def test_ts_range_index_scan_passes():
+    plan = scan("Index Scan", "dht", "((host = ANY ($3)) AND (ts >= $1) AND (ts < $2))")
+    assert dhtBucket.unbounded_scans(plan, COLUMNS) == []
+
+
+def test_host_only_index_scan_fails():
+    plan = scan("Index Only Scan", "dht", "(host = ANY ($3))")
+    assert dhtBucket.unbounded_scans(plan, COLUMNS) == ["index only scan on dht without a ts range"]
+
+
+def test_seq_scan_fails():
+    assert dhtBucket.unbounded_scans(scan("Seq Scan", "dht"), COLUMNS) == ["seq scan on dht"]
+
+
+def test_bitmap_scan_uses_its_index_conds():
+    bounded = {"Node Type": "Bitmap Index Scan", "Index Cond": "((host = ANY ($3)) AND (bucket_start >= $1))"}
+    host_only = {"Node Type": "Bitmap Index Scan", "Index Cond": "(host = ANY ($3))"}
+    assert dhtBucket.unbounded_scans(scan("Bitmap Heap Scan", "dht_rollup_1h", plans=[bounded]), COLUMNS) == []
+    assert dhtBucket.unbounded_scans(scan("Bitmap Heap Scan", "dht_rollup_1h", plans=[host_only]), COLUMNS) == [
+        "bitmap heap scan on dht_rollup_1h without a bucket_start range"
+    ]
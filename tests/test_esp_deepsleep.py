@@ -0,0 +1,134 @@
+import json
+import os
+import runpy
+import sys
+import time
+
+import pytest
+
+import esppath
+import mqttbroker
+import utime
+
+# Modules a wake loads afresh, and the stand-ins that keep their state
+# (RTC memory, reset cause) from one wake to the next
+NODE = ("boot", "main", "config", "wifi", "readings", "payload", "rtcstate", "umqttsimple")
+BOARD = ("machine", "network", "dht", "ntptime", "esp", "urequests", "micropython", "usocket")
+
+
+@pytest.fixture
+def node(monkeypatch):
+    saved = dict(sys.modules)
+    for name in NODE + BOARD:
+        sys.modules.pop(name, None)
+    # MicroPython's time has the ticks functions, CPython's doesn't; Wi-Fi
+    # waits are skipped
+    monkeypatch.setattr(time, "ticks_ms", utime.ticks_ms, raising=False)
+    monkeypatch.setattr(time, "sleep_ms", lambda ms: None, raising=False)
+    broker = mqttbroker.Broker()
+    monkeypatch.setitem(sys.modules, "usocket", mqttbroker.socket_module(broker.port))
+    import machine
+
+    def wake(**settings):
+        # One reset: boot.py then main.py in a shared namespace, as on the
+        # board, until main.py goes back to sleep
+        for name in NODE:
+            sys.modules.pop(name, None)
+        import config
+        config.MODE = "deepsleep"
+        config.WIFI_EVERY = 4
+        for k, v in settings.items():
+            setattr(config, k, v)
+        ns = runpy.run_path(os.path.join(esppath.ESP, "boot.py"))
+        with pytest.raises(machine.DeepSleep):
+            runpy.run_path(os.path.join(esppath.ESP, "main.py"), init_globals=ns)
+        return ns
+
+    wake.broker = broker
+    yield wake
+    broker.close()
+    sys.modules.clear()
+    sys.modules.update(saved)
+
+
+def saved_readings():
+    import readings
+    import rtcstate
+    buffered = readings.Readings(240)
+    rtcstate.load(buffered)
+    return [buffered.get(k) for k in range(len(buffered))]
+
+
+def measurements(broker, n):
+    deadline = time.monotonic() + 2
+    while len(broker.published) < n and time.monotonic() < deadline:
+        time.sleep(0.01)
+    out = []
+    for topic, msg, *_ in broker.published:
+        assert topic == b"dht_sensor_measurement"
+        doc = json.loads(msg)
+        out += doc.get("batch", [doc])
+    return out
+
+
+def test_publishes_every_nth_wake_from_rtc_memory(node):
+    import dht
+    import machine
+
+    for i in range(3):
+        dht.temperature = 20 + i
+        node()
+        assert node.broker.published == []
+        assert machine.cause == machine.DEEPSLEEP_RESET
+    assert [temp for ts, temp, hum in saved_readings()] == [20, 21, 22]
+
+    dht.temperature = 23
+    node()
+    batch = measurements(node.broker, 1)
+    assert [r["temp"] for r in batch] == [20, 21, 22, 23]
+    assert all(r["ts"] > 1700000000 for r in batch)
+    assert saved_readings() == []
+    assert len(machine.slept) == 4
+
+
+def test_reconnects_to_the_cached_access_point(node):
+    import network
+
+    for _ in range(8):
+        node()
+    assert node.broker.connects == 2
+    assert len(measurements(node.broker, 2)) == 8
+    # The power-on boot connects normally and the first publishing wake
+    # scans; the second goes straight to the cached BSSID
+    assert network.scans == 1
+    bssid = network.access_points[0][1]
+    assert network.connects[-1] == ("BobsHauntedGecko", bssid)
+
+
+def test_readings_wait_while_wifi_is_down(node):
+    import network
+
+    node()
+    network.reachable = False
+    for _ in range(3):
+        node(WIFI_TIMEOUT=0)
+    assert node.broker.published == []
+    assert len(saved_readings()) == 4
+    network.reachable = True
+    for _ in range(4):
+        node()
+    assert len(measurements(node.broker, 1)) == 8
+
+
+def test_readings_stay_until_acknowledged(node):
+    # The broker drops the connection instead of acknowledging
+    node.broker.hangups = 1
+    for _ in range(4):
+        node()
+    assert len(measurements(node.broker, 1)) == 4
+    assert len(saved_readings()) == 4
+    node.broker.published.clear()
+    for _ in range(4):
+        node()
+    assert len(measurements(node.broker, 1)) == 8
+    assert saved_readings() == []
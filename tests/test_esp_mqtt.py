@@ -0,0 +1,145 @@
+import time
+
+import pytest
+
+import esppath  # noqa: F401
+import mqttbroker
+import umqttsimple
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    brokers = []
+
+    def start(**kwargs):
+        b = mqttbroker.Broker(**kwargs)
+        monkeypatch.setattr(umqttsimple, "socket", mqttbroker.socket_module(b.port))
+        brokers.append(b)
+        return b
+
+    yield start
+    for b in brokers:
+        b.close()
+
+
+def wait_for(cond, timeout=2):
+    end = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+
+def client(received, **kwargs):
+    c = umqttsimple.MQTTClient(b"test", "mqtt.lan", **kwargs)
+    c.set_callback(lambda topic, msg: received.append((bytes(topic), bytes(msg))))
+    return c
+
+
+def test_buffered_publish_is_one_write(broker):
+    b = broker()
+    c = client([], bufsize=256)
+    c.connect()
+    c.subscribe(b"cmd")
+    writes = c.sock.writes
+    c.publish(b"dht_sensor_measurement", memoryview(b'{"temp": 21.5}'))
+    c.publish("dht_sensor_events", "starting")
+    assert c.sock.writes - writes == 2
+    # Too big for the buffer: the old multi-write path
+    c.publish(b"big", b"x" * 400)
+    wait_for(lambda: len(b.published) == 3)
+    assert [(t, m) for t, m, *_ in b.published] == [
+        (b"dht_sensor_measurement", b'{"temp": 21.5}'),
+        (b"dht_sensor_events", b"starting"),
+        (b"big", b"x" * 400),
+    ]
+
+
+def test_poll_never_blocks_and_reassembles(broker):
+    b = broker()
+    received = []
+    c = client(received, bufsize=256)
+    c.connect()
+    c.subscribe(b"cmd")
+    t = time.monotonic()
+    assert c.poll() is None
+    assert time.monotonic() - t < 0.05
+    data = mqttbroker.publish_packet(b"cmd", b"reboot") + mqttbroker.publish_packet(b"cmd", b"q", qos=1, pid=7)
+    b.send(data[:5])
+    time.sleep(0.05)
+    assert c.poll() is None and received == []
+    b.send(data[5:])
+    wait_for(lambda: c.poll() or received)
+    wait_for(lambda: len(received) == 2 or c.poll())
+    assert received == [(b"cmd", b"reboot"), (b"cmd", b"q")]
+    # QoS 1 delivery is acknowledged
+    wait_for(lambda: b.puback_from_client == [7])
+
+
+def test_packet_split_across_the_buffer_tail(broker):
+    b = broker()
+    received = []
+    c = client(received, bufsize=64)
+    c.connect()
+    # The second packet fits the buffer, but not after the first one
+    first = mqttbroker.publish_packet(b"cmd", b"a" * 20)
+    second = mqttbroker.publish_packet(b"cmd", b"b" * 40)
+    b.send(first + second[:20])
+    wait_for(lambda: c.poll() or received)
+    assert received == [(b"cmd", b"a" * 20)]
+    b.send(second[20:])
+    wait_for(lambda: c.poll() or len(received) == 2)
+    assert received == [(b"cmd", b"a" * 20), (b"cmd", b"b" * 40)]
+
+
+def test_qos1_stop_and_wait_without_window(broker):
+    b = broker()
+    c = client([], bufsize=256)
+    c.connect()
+    c.publish(b"t", b"one", qos=1)
+    assert c.acked == 1
+    assert b.published[0][2:] == (1, False, 1)
+
+
+def test_oversized_packet_is_an_error(broker):
+    b = broker()
+    c = client([], bufsize=64)
+    c.connect()
+    b.send(mqttbroker.publish_packet(b"cmd", b"x" * 100))
+    with pytest.raises(umqttsimple.MQTTException):
+        wait_for(lambda: c.poll() and False)
+
+
+def test_window_keeps_publishing_while_acks_are_outstanding(broker):
+    broker(drop_acks=3)
+    c = client([], bufsize=256, window=4, retry_ms=60000)
+    c.connect()
+    pids = [c.publish(b"t", b"%d" % i, qos=1) for i in range(4)]
+    wait_for(lambda: c.poll() or not c.pending(pids[3]))
+    assert [c.pending(pid) for pid in pids] == [True, True, True, False]
+    assert c.inflight() == 3
+    assert c.pending(c.publish(b"t", b"qos0")) is False
+
+
+def test_unacknowledged_publish_is_resent_with_dup(broker):
+    b = broker(drop_acks=1)
+    c = client([], bufsize=256, window=2, retry_ms=50)
+    c.connect()
+    pid = c.publish(b"t", b"once", qos=1)
+    wait_for(lambda: c.poll() or not c.pending(pid))
+    assert [(m, dup, p) for _, m, _, dup, p in b.published] == [(b"once", False, pid), (b"once", True, pid)]
+
+
+def test_window_gives_up_and_resends_on_connect(broker):
+    b = broker(drop_acks=4)
+    c = client([], bufsize=256, window=2, retry_ms=10)
+    c.connect()
+    pid = c.publish(b"t", b"lost", qos=1)
+    with pytest.raises(OSError):
+        wait_for(lambda: c.poll() and False)
+    wait_for(lambda: len(b.published) == 1 + umqttsimple.MAX_RETRIES)
+    assert c.pending(pid)
+    c.sock.close()
+    c.connect()
+    c.drain()
+    assert not c.pending(pid)
+    assert b.published[-1][1:] == (b"lost", 1, True, pid)
@@ -0,0 +1,73 @@
+import asyncio
+
+import dhtIngest
+
+
+async def relay_server(path, connections):
+    # Serves each connection the next list of lines, then closes it
+    async def on_client(reader, writer):
+        for line in connections.pop(0) if connections else []:
+            writer.write(line)
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_unix_server(on_client, path)
+
+
+async def collect(link, n):
+    out = []
+    async for item in link.payloads():
+        out.append(item)
+        if len(out) == n:
+            return out
+
+
+def test_relay_link_reads_a_state_line_over_the_default_limit(tmp_path):
+    path = str(tmp_path / "relay.sock")
+    big = b"x" * (200 * 1024)
+
+    async def run():
+        server = await relay_server(path, [[dhtIngest.encode_line(dhtIngest.STATE_TOPIC, big), b"t ok\n"]])
+        async with server:
+            return await asyncio.wait_for(collect(dhtIngest.RelayLink(path), 2), 5)
+
+    assert asyncio.run(run()) == [(dhtIngest.STATE_TOPIC, big), ("t", b"ok")]
+
+
+def test_relay_link_reconnects_after_a_bad_line(tmp_path):
+    path = str(tmp_path / "relay.sock")
+
+    async def run():
+        server = await relay_server(path, [[b"t " + b"x" * 1000 + b"\n"], [b"t ok\n"]])
+        async with server:
+            return await asyncio.wait_for(collect(dhtIngest.RelayLink(path, limit=100), 1), 5)
+
+    assert asyncio.run(run()) == [("t", b"ok")]
+
+
+def test_supervise_restarts_a_failed_task():
+    runs = []
+
+    async def task():
+        runs.append(1)
+        if len(runs) == 1:
+            raise RuntimeError("boom")
+        await asyncio.sleep(10)
+
+    async def run():
+        t = asyncio.create_task(dhtIngest.supervise("test", task, delay=0))
+        while len(runs) < 2:
+            await asyncio.sleep(0.01)
+        t.cancel()
+
+    asyncio.run(run())
+    assert len(runs) == 2
+
+
+def test_relay_skips_payloads_that_are_not_objects(capsys):
+    relay = dhtIngest.Relay()
+    for payload in (b"[]", b"1", b'"x"', b"null"):
+        relay.apply(dhtIngest.MEASUREMENT_TOPIC, payload)
+    assert capsys.readouterr().out.count("Bad message") == 4
+    relay.apply(dhtIngest.MEASUREMENT_TOPIC, b'{"host": "a", "sensor": 14, "temp": 20.5, "hum": 40.0}')
+    assert relay.latest["a"]["temp"] == 20.5
@@ -0,0 +1,82 @@
+import os
+import random
+
+import pytest
+
+import cpstubs
+import dhtBucket
+
+CODE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lcdPico1.8", "code.py")
+
+
+class FakeMQTT:
+    def __init__(self):
+        self.subs = []
+
+    def subscribe(self, topic):
+        self.subs.append(topic)
+
+    def unsubscribe(self, topic):
+        self.subs.remove(topic)
+
+
+@pytest.fixture
+def lcd(monkeypatch):
+    # code.py's whole startup path, up to (not into) its main loop
+    cpstubs.install(monkeypatch)
+    with open(CODE) as f:
+        src = f.read()
+    ns = {"__name__": "code"}
+    exec(compile(src[:src.index("# Main loop")], CODE, "exec"), ns)
+    ns["mqtt"] = FakeMQTT()
+    return ns
+
+
+def payload(rows, bucket_seconds, open_start):
+    return dhtBucket.bin_body(bucket_seconds, open_start, dhtBucket.bin_columns(rows, bucket_seconds, open_start))
+
+
+def test_startup_draws_empty_chart(lcd):
+    chart = lcd["chart"]
+    assert chart.bitmap.width == lcd["chart_width"]
+    assert [lbl.text for lbl in chart.labels] != ["", "", ""]
+
+
+def test_config_subscribes_series(lcd):
+    lcd["handle_message"](None, lcd["MQTT_CONFIG_TOPIC"], '{"metric": "hum", "period": "15min", "count": 48}')
+    assert lcd["mqtt"].subs == ["dht_bucket_update/900/48"]
+    assert lcd["BUCKET_COUNT"] == 48
+
+
+def test_incremental_render_matches_full(lcd):
+    # Every update drawn incrementally must leave the same pixels as drawing
+    # the ring from scratch
+    handle, Chart = lcd["handle_message"], lcd["Chart"]
+    handle(None, lcd["MQTT_CONFIG_TOPIC"], '{"metric": "temp", "period": "1hours", "count": 24}')
+    topic = lcd["mqtt"].subs[-1]
+    bs = 3600
+    rnd = random.Random(1)
+    vals = {}
+
+    def row(i):
+        if i not in vals:
+            missing = rnd.random() < 0.1
+            vals[i] = (i * bs, None if missing else 20 + rnd.random() * 3, 50.0, 20 + rnd.random() * 3, 50.0)
+        return vals[i]
+
+    newest = 1000
+    handle(None, topic, payload([row(newest - a) for a in range(24)], bs, newest * bs))
+    for _ in range(150):
+        if rnd.random() < 0.2:
+            newest += 1 if rnd.random() < 0.8 else 2
+            rows = [row(newest - a) for a in range(24 if rnd.random() < 0.5 else 1)]
+        else:
+            vals[newest] = (newest * bs, 21 + rnd.random() * 0.5, 50.0, 21 + rnd.random() * 0.5, 50.0)
+            rows = [vals[newest]]
+        handle(None, topic, payload(rows, bs, newest * bs))
+        ref = Chart()
+        # Same scale: a fresh chart would not have the running one's
+        # hysteresis
+        ref.key = lcd["chart"].key
+        ref.render(lcd["ring"])
+        assert ref.bitmap.px == lcd["chart"].bitmap.px
@@ -0,0 +1,26 @@
+from dhtOpenBuckets import OpenBuckets
+
+NOW = 1000 * 86400
+
+
+def test_client_sizes_are_capped_least_recently_used_first():
+    ob = OpenBuckets([60, 3600], max_sizes=4)
+    assert ob.track(120, NOW) and ob.track(180, NOW)
+    assert not ob.track(120, NOW)
+    assert ob.track(240, NOW)
+    assert sorted(ob.sizes) == [60, 120, 240, 3600]
+    assert ob.row(180, NOW + 600) is None
+
+
+def test_pinned_sizes_are_never_given_up():
+    ob = OpenBuckets([60, 3600], max_sizes=2)
+    assert not ob.track(120, NOW)
+    assert sorted(ob.sizes) == [60, 3600]
+
+
+def test_load_adopts_only_tracked_sizes():
+    ob = OpenBuckets([60], max_sizes=2)
+    state = {"60": [NOW - 600, NOW, {"a": [1.0, 1, 1.0, 1.0, 2.0, 1, 2.0, 2.0]}], "7": [NOW - 600, NOW, {}]}
+    ob.load(state)
+    assert sorted(ob.sizes) == [60]
+    assert ob.sizes[60][0] == NOW - 600
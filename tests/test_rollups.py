@@ -0,0 +1,50 @@
+import dhtRollups
+from dhtStorage import ROLLUPS
+
+
+class Cursor:
+    # Records statements; answers the epoch lookup with `epoch`
+    def __init__(self, epoch):
+        self.epoch = epoch
+        self.executed = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return (self.epoch,)
+
+
+class Conn:
+    def __init__(self, epoch):
+        self.cur = Cursor(epoch)
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        pass
+
+
+def backfill_starts(epoch):
+    conn = Conn(epoch)
+    dhtRollups.backfill(conn, "since")
+    return [params[0] for sql, params in conn.cur.executed if "INSERT INTO" in sql]
+
+
+def test_backfill_starts_each_rollup_on_a_bucket_boundary():
+    # 2024-03-05 10:17:30 UTC, inside a minute, an hour and a day
+    since = 1709633850.0
+    assert backfill_starts(since) == [since // s * s for s, _ in ROLLUPS]
+    assert backfill_starts(since) == [1709633820.0, 1709632800.0, 1709596800.0]
+
+
+def test_backfill_everything():
+    assert backfill_starts(float("-inf")) == [float("-inf")] * len(ROLLUPS)
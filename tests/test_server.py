@@ -0,0 +1,136 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+import dhtBucket
+from dhtPublish import BucketPublisher
+
+HOUR = 3600
+
+
+@pytest.fixture
+def server(request, monkeypatch, tmp_path):
+    # A fresh dhtServer on the memory backend (or the parametrized one),
+    # without ingest
+    monkeypatch.setenv("DHT_BACKEND", getattr(request, "param", "memory"))
+    monkeypatch.setenv("DHT_DB", str(tmp_path / "dht.db"))
+    monkeypatch.setenv("DHT_INGEST", "off")
+    monkeypatch.chdir(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "web_server"))
+    sys.modules.pop("dhtServer", None)
+    import dhtServer
+
+    with TestClient(dhtServer.app) as client:
+        dhtServer.client = client
+        yield dhtServer
+    sys.modules.pop("dhtServer", None)
+
+
+def reading(ts, temp):
+    return (dhtBucket.HOST_IN, 14, "x", temp, 50.0, ts)
+
+
+def message(ts, temp):
+    d = {"host": dhtBucket.HOST_IN, "client_id": "x", "sensor": 14, "batch": [{"ts": ts, "temp": temp, "hum": 50.0}]}
+    return json.dumps(d).encode()
+
+
+def test_late_reading_invalidates_cached_buckets(server):
+    now = time.time()
+    last_hour = now // HOUR * HOUR - HOUR
+    server.store.append_batch([reading(last_hour + 60, 20.0)])
+    assert server.client.get("/bucket/1hours/3").json()[-1]["in_temp"] == 20.0
+    assert server.bucket_cache.stats()["entries"] == 1
+
+    # A node replays a buffered reading for the closed hour; the logger
+    # stores it too
+    server.store.append_batch([reading(last_hour + 120, 22.0)])
+    server.on_message("dht_sensor_measurement", message(last_hour + 120, 22.0))
+    assert server.bucket_cache.stats()["entries"] == 0
+    assert server.client.get("/bucket/1hours/3").json()[-1]["in_temp"] == 21.0
+
+
+def test_current_reading_keeps_cached_buckets(server):
+    server.client.get("/bucket/1hours/3")
+    server.on_message("dht_sensor_measurement", message(time.time(), 22.0))
+    assert server.bucket_cache.stats()["entries"] == 1
+
+
+def test_cache_expires_early_while_a_late_reading_settles(server):
+    cache = server.BucketCache(1024, settle=5)
+    now = 100 * HOUR + 10
+    cache.invalidate(99 * HOUR + 60, now)
+    cache.put((HOUR, 3, "rows"), b"[]", 101 * HOUR, now)
+    cache.put((60, 3, "rows"), b"[]", now + 60, now)
+    assert cache.get((HOUR, 3, "rows"), now + 6) is None
+    assert cache.get((60, 3, "rows"), now + 6) is None
+    cache.put((HOUR, 3, "rows"), b"[]", 101 * HOUR, now + 6)
+    assert cache.get((HOUR, 3, "rows"), now + 7) == b"[]"
+
+
+def test_late_reading_republishes_retained_series():
+    publisher = BucketPublisher(None, None, settle=5)
+    publisher.subscribe(HOUR, 24)
+    publisher.subscribe(60, 10)
+    now = time.time()
+    publisher.on_late(now // HOUR * HOUR - 2 * HOUR)
+    assert set(publisher.due) == {(HOUR, 24)}
+    assert publisher.due[(HOUR, 24)] <= time.time() + 5
+
+
+def test_control_subscriptions_are_capped_and_expire():
+    publisher = BucketPublisher(None, None, max_subs=4, ttl=HOUR)
+    publisher.subscribe(HOUR, 24, pinned=True, now=0)
+    for minutes in range(1, 10):
+        publisher.subscribe(minutes * 60, 10, now=minutes)
+    # The pinned series and the three most recently asked for
+    assert list(publisher.subs) == [(HOUR, 24), (420, 10), (480, 10), (540, 10)]
+    publisher.subscribe(480, 10, now=HOUR)
+    publisher.expire(HOUR + 100)
+    # Not asked for within the hour: given up, but never the newest or pinned
+    assert list(publisher.subs) == [(HOUR, 24), (480, 10)]
+    publisher.expire(10 * HOUR)
+    assert list(publisher.subs) == [(HOUR, 24), (480, 10)]
+
+
+def test_client_chosen_periods_fall_back_to_the_database(server):
+    now = time.time()
+    for minutes in range(2, 40):
+        assert server.client.get(f"/bucket/{minutes}minutes/2").status_code == 200
+    assert len(server.open_buckets.sizes) == server.dhtIngest.MAX_OPEN_BUCKETS
+    # The open bucket of an untracked size is read from storage
+    server.store.append_batch([reading(now, 19.0)])
+    assert server.client.get("/bucket/2minutes/1").json()[0]["in_temp"] == 19.0
+
+
+def test_engines_are_cached_separately(server):
+    server.store.append_batch([reading(time.time() - 2 * HOUR, 20.0)])
+    sql = server.client.get("/bucket/1hours/3?engine=sql").json()
+    assert server.client.get("/bucket/1hours/3?engine=numpy").json() == sql
+    assert server.bucket_cache.stats()["entries"] == 2
+    assert server.bucket_cache.stats()["hits"] == 0
+
+
+def test_since_must_be_finite(server):
+    for since in ("nan", "inf", "-inf", "1e999", "soon"):
+        r = server.client.get(f"/bucket/1hours/3?since={since}")
+        assert r.status_code == 400, since
+    assert server.client.get(f"/bucket/1hours/3?since={time.time() - HOUR}").status_code == 200
+
+
+@pytest.mark.parametrize("server", ["memory", "sqlite"], indirect=True)
+def test_window_reaching_before_the_epoch_is_clamped(server):
+    server.store.append_batch([reading(time.time() - 2 * 86400, 20.0)])
+    rows = server.client.get("/bucket/1days/1000000")
+    assert rows.status_code == 200
+    assert [r["in_temp"] for r in rows.json()] == [20.0]
+    assert server.client.get("/bucket.bin/1days/65535").status_code == 200
+
+
+@pytest.mark.parametrize("server", ["memory", "sqlite"], indirect=True)
+def test_period_past_the_last_representable_time_is_rejected(server):
+    assert server.client.get("/bucket/1000000000days/1").status_code == 400
+    assert server.client.get("/bucket/1000000days/2").status_code == 200
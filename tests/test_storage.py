@@ -0,0 +1,211 @@
+import os
+import time
+
+import pytest
+
+import dhtAggregate
+import dhtArchive
+import dhtPartitions
+import dhtStorage
+
+DAY = 86400
+
+
+class HostsRequiredStore(dhtStorage.MemoryStore):
+    # Like PostgresStore: no host list, no query
+    def range_query(self, start, end, hosts=None):
+        if hosts is None:
+            raise ValueError("host list required")
+        return super().range_query(start, end, hosts)
+
+
+def test_tiered_passes_hosts_to_both_tiers(tmp_path):
+    today = int(time.time()) // DAY * DAY
+    old = [("a", 14, "x", 20.0, 50.0, today - 5 * DAY + 60), ("b", 14, "y", 10.0, 60.0, today - 5 * DAY + 60)]
+    new = [("a", 14, "x", 21.0, 51.0, today + 60), ("b", 14, "y", 11.0, 61.0, today + 60)]
+    source = dhtStorage.MemoryStore()
+    source.append_batch(old)
+    dhtArchive.export(source, str(tmp_path), ["a", "b"], today - 5 * DAY, today)
+    hot = HostsRequiredStore()
+    hot.append_batch(new)
+    store = dhtStorage.TieredStore(hot, dhtArchive.ArchiveStore(str(tmp_path)), hot_days=1)
+
+    rows = store.range_query(today - 10 * DAY, today + DAY, ["a"])
+    assert [(r[0], r[3], r[5]) for r in rows] == [("a", 20.0, old[0][5]), ("a", 21.0, new[0][5])]
+    aggs = store.bucket_aggregate(DAY, today - 10 * DAY, today + DAY, ["a"])
+    assert [(r[0], r[1], r[2]) for r in aggs] == [(today, "a", 21.0), (today - 5 * DAY, "a", 20.0)]
+
+
+def test_tiered_reads_days_not_yet_exported_from_the_hot_store(tmp_path):
+    today = int(time.time()) // DAY * DAY
+    rows = [("a", 14, "x", float(age), 50.0, today - age * DAY + 60) for age in (8, 5, 0)]
+    hot = dhtStorage.MemoryStore()
+    hot.append_batch(rows)
+    store = dhtStorage.TieredStore(hot, dhtArchive.ArchiveStore(str(tmp_path)), hot_days=1)
+    # Nothing exported yet: all hot
+    assert [r[3] for r in store.range_query(today - 10 * DAY, today + DAY, ["a"])] == [8.0, 5.0, 0.0]
+    # Only the oldest day exported; the days after it are not in the archive
+    dhtArchive.export(hot, str(tmp_path), ["a"], today - 8 * DAY, today - 7 * DAY)
+    assert store.cutoff() == today - 7 * DAY
+    assert [r[3] for r in store.range_query(today - 10 * DAY, today + DAY, ["a"])] == [8.0, 5.0, 0.0]
+    aggs = store.bucket_aggregate(DAY, today - 10 * DAY, today + DAY, ["a"])
+    assert [r[2] for r in aggs] == [0.0, 5.0, 8.0]
+    with pytest.raises(TypeError):
+        store.cold.append_batch(rows)
+
+
+def test_archive_clamps_out_of_range_values():
+    fixed = dhtArchive.to_fixed([21.5, 1e9, -1e9, float("inf"), float("nan"), None])
+    assert fixed.tolist() == [2150, 32767, -32767, 32767, dhtArchive.MISSING, dhtArchive.MISSING]
+
+
+def test_monthly_range_spans_more_partitions_than_attach_allows(tmp_path):
+    store = dhtStorage.SqliteStore(str(tmp_path), layout="monthly")
+    store.open()
+    # One reading a month for 24 months
+    first = 1640995200  # 2022-01-01
+    rows = [("a", 14, "x", float(i), 50.0, first + i * 31 * DAY) for i in range(24)]
+    store.append_batch(rows)
+    store.close()
+    assert len(dhtPartitions.list_partitions(str(tmp_path))) == 24
+
+    got = store.range_query(first, first + 800 * DAY, ["a"])
+    assert [r[3] for r in got] == [float(i) for i in range(24)]
+    assert len(store.bucket_aggregate(31 * DAY, first, first + 800 * DAY)) == 24
+
+
+# Backend conformance: every local backend, and the NumPy engine over each,
+# must give the same rows and aggregates for the same readings
+
+HOSTS = ["10.0.0.31", "10.0.0.32"]
+
+
+def dataset(end, days=50, step=600):
+    # Two hosts every `step` seconds for `days` up to `end`, crossing month
+    # boundaries, with some missing values
+    rows = []
+    for i, ts in enumerate(range(end - days * DAY, end, step)):
+        for h, host in enumerate(HOSTS):
+            temp = None if i % 97 == h else round(15 + 10 * h + (i % 50) / 10, 1)
+            hum = None if i % 89 == h else round(40 + (i % 30) / 10, 1)
+            rows.append((host, 14, "c%d" % h, temp, hum, ts))
+    return rows
+
+
+def make_store(kind, path, rows):
+    if kind == "memory":
+        store = dhtStorage.MemoryStore()
+    elif kind == "sqlite":
+        store = dhtStorage.SqliteStore(str(path / "dht.db"))
+    elif kind == "sqlite-monthly":
+        store = dhtStorage.SqliteStore(str(path / "months"), layout="monthly")
+    else:
+        hot = dhtStorage.MemoryStore()
+        store = dhtStorage.TieredStore(hot, dhtArchive.ArchiveStore(str(path / "cold")), hot_days=10)
+    store.open()
+    for i in range(0, len(rows), 500):
+        assert store.append_batch(rows[i:i + 500]) == []
+    if kind == "tiered":
+        dhtArchive.export(hot, str(path / "cold"), HOSTS, rows[0][5], store.retention_cutoff())
+    return store
+
+
+BACKENDS = ["memory", "sqlite", "sqlite-monthly", "tiered"]
+END = int(time.time()) // DAY * DAY + DAY // 2
+ROWS = dataset(END)
+
+
+@pytest.fixture(scope="module", params=BACKENDS)
+def backend(request, tmp_path_factory):
+    store = make_store(request.param, tmp_path_factory.mktemp(request.param), ROWS)
+    yield store
+    store.close()
+
+
+def comparable(rows):
+    # What every backend keeps: the archive drops sensor and client id
+    return [(r[0], r[3], r[4], float(r[5])) for r in rows]
+
+
+def expected_rows(start, end, hosts):
+    return [r for r in ROWS if start <= r[5] < end and (hosts is None or r[0] in hosts)]
+
+
+def assert_same_aggregates(got, want):
+    # Newest bucket first; the host order within a bucket is unspecified
+    assert [r[0] for r in got] == sorted((r[0] for r in got), reverse=True)
+    got, want = sorted(got, key=lambda r: r[:2]), sorted(want, key=lambda r: r[:2])
+    assert [r[:2] for r in got] == [r[:2] for r in want]
+    for g, w in zip(got, want):
+        assert g[2:] == pytest.approx(w[2:])
+
+
+@pytest.mark.parametrize("hosts", [None, HOSTS[:1], HOSTS])
+def test_range_query_conforms(backend, hosts):
+    start, end = END - 40 * DAY + 1234, END - 3 * DAY
+    assert comparable(backend.range_query(start, end, hosts)) == comparable(expected_rows(start, end, hosts))
+
+
+@pytest.mark.parametrize("bucket_seconds", [3600, 86400, 7 * DAY])
+def test_bucket_aggregate_conforms(backend, bucket_seconds):
+    start, end = END - 45 * DAY, END
+    want = dhtStorage.aggregate_rows(expected_rows(start, end, HOSTS), bucket_seconds)
+    assert_same_aggregates(backend.bucket_aggregate(bucket_seconds, start, end, HOSTS), want)
+    engine = dhtAggregate.NumpyEngine(backend)
+    assert_same_aggregates(engine.bucket_aggregate(bucket_seconds, start, end, HOSTS), want)
+
+
+@pytest.mark.parametrize("hosts", [None, HOSTS])
+def test_range_columns_conform(backend, hosts):
+    if not hasattr(backend, "range_columns"):
+        pytest.skip("no columnar read")
+    start, end = END - 40 * DAY + 1234, END - 3 * DAY
+    got = backend.range_columns(start, end, hosts)
+    want = dhtAggregate.columns_from_rows(expected_rows(start, end, hosts), hosts)
+    assert got[4] == want[4]
+
+    def columns(c):
+        # (ts, host, temp, hum) in a fixed order; NaN compared as None
+        return sorted(zip(c[0].tolist(), c[1].tolist(), *[[None if v != v else v for v in a.tolist()] for a in c[2:4]]))
+
+    assert columns(got) == columns(want)
+
+
+def test_empty_range(backend):
+    assert backend.range_query(END + DAY, END + 2 * DAY, HOSTS) == []
+    assert backend.bucket_aggregate(3600, END + DAY, END + 2 * DAY, HOSTS) == []
+    assert dhtAggregate.NumpyEngine(backend).bucket_aggregate(3600, END + DAY, END + 2 * DAY, HOSTS) == []
+
+
+def test_append_batch_returns_the_rows_it_did_not_write(tmp_path):
+    store = dhtStorage.SqliteStore(str(tmp_path), layout="monthly")
+    store.open()
+    jan, feb = 1672531200, 1675209600  # 2023-01-01, 2023-02-01
+    rows = [("a", 14, "x", 20.0, 50.0, jan + 60), ("a", 14, "x", 21.0, 51.0, feb + 60)]
+    # February's partition can't be opened
+    os.mkdir(dhtPartitions.partition_path(str(tmp_path), "2023-02"))
+    remainder = store.append_batch(rows)
+    assert remainder == rows[1:]
+    assert len(rows) == 2
+    os.rmdir(dhtPartitions.partition_path(str(tmp_path), "2023-02"))
+    assert store.append_batch(remainder) == []
+    assert [r[3] for r in store.range_query(jan, feb + DAY, ["a"])] == [20.0, 21.0]
+
+
+@pytest.mark.parametrize("kind", BACKENDS[:3])
+def test_throughput(kind, tmp_path):
+    # Generous floors; run with -s for the rates
+    rows = dataset(END, days=35, step=300)
+    t = time.perf_counter()
+    store = make_store(kind, tmp_path, rows)
+    write = len(rows) / (time.perf_counter() - t)
+    t = time.perf_counter()
+    n = len(store.range_query(END - 35 * DAY, END, HOSTS))
+    read = n / (time.perf_counter() - t)
+    t = time.perf_counter()
+    store.bucket_aggregate(3600, END - 35 * DAY, END, HOSTS)
+    agg = time.perf_counter() - t
+    store.close()
+    print(f"{kind}: {write:.0f} rows/s written, {read:.0f} rows/s read, 35 days hourly in {agg * 1000:.0f} ms")
+    assert n == len(rows)
+    assert write > 5000 and read > 5000 and agg < 5
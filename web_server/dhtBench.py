@@ -0,0 +1,357 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import dhtBucket
+import dhtStorage
+
+# Benchmarks for the web server, run from this directory:
+#   load     requests/s and latency for one path, against --url or, without
+#            one, this app in-process on a seeded local store
+#   rollups  raw vs rollup bucket query latency as iso.dht grows, in a
+#            scratch Postgres database
+#   engine   SQL vs NumPy (dhtAggregate.NumpyEngine) bucket aggregation on
+#            the same readings, in local SQLite files or with --dsn Postgres
+#   workers  /latest and /bucket requests/s for uvicorn --workers N behind the
+#            dhtIngest.py relay, as server_workers.sh runs it
+#
+# The in-process app reads DHT_BACKEND and friends like the server does
+# (see dhtStorage.store_from_config); by default it gets a scratch SQLite
+# file. Point it at a local Postgres with DHT_BACKEND=postgres PSQL_DSN=...
+
+
+def synthetic_rows(days, step=60, end=None, hosts=dhtBucket.HOSTS):
+    # One reading per host every `step` seconds for `days` up to `end`
+    if end is None:
+        end = int(time.time())
+    rows = []
+    for i, ts in enumerate(range(end - days * 86400, end, step)):
+        for h, host in enumerate(hosts):
+            rows.append((host, 14, f"bench{h}", 15 + 10 * h + (i % 600) / 100, 40 + (i % 300) / 10, ts))
+    return rows
+
+
+def seed(store, rows, batch=5000):
+    for i in range(0, len(rows), batch):
+        store.append_batch(rows[i:i + batch])
+
+
+async def hammer(client, paths, concurrency, seconds):
+    # `concurrency` clients requesting `paths` round robin for `seconds`;
+    # returns (latencies of the 2xx/304 answers, number of other answers)
+    latencies = []
+    errors = 0
+    stop = time.perf_counter() + seconds
+
+    async def one(k):
+        nonlocal errors
+        while time.perf_counter() < stop:
+            path = paths[k % len(paths)]
+            k += concurrency
+            t = time.perf_counter()
+            try:
+                r = await client.get(path)
+                ok = r.status_code < 300 or r.status_code == 304
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - t)
+            else:
+                errors += 1
+
+    await asyncio.gather(*(one(k) for k in range(concurrency)))
+    return latencies, errors
+
+
+def report(label, latencies, errors, seconds):
+    latencies = sorted(latencies)
+    if not latencies:
+        print(f"{label}: no successful requests, {errors} errors")
+        return 0
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    rate = len(latencies) / seconds
+    print(
+        f"{label}: {rate:.0f} req/s, p50 {pct(0.5):.1f} ms, p95 {pct(0.95):.1f} ms, "
+        f"p99 {pct(0.99):.1f} ms, {errors} errors"
+    )
+    return rate
+
+
+async def load(args):
+    import httpx
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+            latencies, errors = await hammer(client, [args.path], args.concurrency, args.seconds)
+        report(args.path, latencies, errors, args.seconds)
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="dhtbench") as scratch:
+        os.environ.setdefault("DHT_BACKEND", "sqlite")
+        os.environ.setdefault("DHT_DB", os.path.join(scratch, "dht.db"))
+        os.environ["DHT_INGEST"] = "off"
+        if args.no_cache:
+            os.environ["BUCKET_CACHE_BYTES"] = "0"
+        import dhtServer
+
+        async with dhtServer.app.router.lifespan_context(dhtServer.app):
+            if args.days:
+                print(f"Seeding {args.days} days of readings")
+                await asyncio.to_thread(seed, dhtServer.store, synthetic_rows(args.days))
+            transport = httpx.ASGITransport(app=dhtServer.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+                latencies, errors = await hammer(client, [args.path], args.concurrency, args.seconds)
+    report(f"{args.path} ({os.environ['DHT_BACKEND']}, in-process)", latencies, errors, args.seconds)
+    return 0
+
+
+# Rows for the rollups benchmark: alternating between two hosts, one reading
+# per host every 15 s going back from now, generated inside Postgres
+BENCH_HOSTS = ["bench0", "bench1"]
+BENCH_DHT_SQL = """
+CREATE SCHEMA IF NOT EXISTS iso;
+CREATE TABLE IF NOT EXISTS iso.dht (
+  id bigserial PRIMARY KEY, host text, sensor integer, client_id text,
+  temp real, hum real, ts timestamptz DEFAULT now()
+);
+"""
+BENCH_INSERT_SQL = """
+INSERT INTO iso.dht (host, sensor, client_id, temp, hum, ts)
+SELECT CASE WHEN g % 2 = 0 THEN 'bench0' ELSE 'bench1' END, 14, 'bench',
+  15 + (g % 200) / 10.0, 40 + (g % 300) / 10.0,
+  now() - (g / 2) * interval '15 seconds'
+FROM generate_series(%s, %s - 1) AS g
+"""
+
+
+def median_ms(fn, repeat):
+    # Median wall time of fn() in ms
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def bench_rows(dsn):
+    # Rows in the scratch database's iso.dht, or None if it holds anything
+    # but benchmark rows
+    import psycopg
+
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(BENCH_DHT_SQL)
+        other = conn.execute("SELECT count(*) FROM iso.dht WHERE host <> ALL(%s)", (BENCH_HOSTS,)).fetchone()[0]
+        if other:
+            print("iso.dht holds real readings; use a scratch database", file=sys.stderr)
+            return None
+        return conn.execute("SELECT count(*) FROM iso.dht").fetchone()[0]
+
+
+def rollups(args):
+    # Grows iso.dht to each row count, refreshes the rollups, and times every
+    # period both ways
+    import psycopg
+    import dhtRollups
+
+    store = dhtStorage.PostgresStore(args.dsn, rollups=False)
+    have = bench_rows(args.dsn)
+    if have is None:
+        return 1
+    store.ensure_index()
+    periods = [item.partition("/") for item in args.periods.split(",")]
+    print("rows        period           raw ms   rollup ms")
+    for rows in sorted(int(float(r)) for r in args.rows.split(",")):
+        with psycopg.connect(args.dsn, autocommit=True) as conn:
+            # Loaded without the trigger, then backfilled in one pass
+            conn.execute("DROP TRIGGER IF EXISTS dht_rollup_insert ON iso.dht")
+            while have < rows:
+                n = min(rows - have, 5_000_000)
+                conn.execute(BENCH_INSERT_SQL, (have, have + n))
+                have += n
+            conn.execute("ANALYZE iso.dht")
+        with psycopg.connect(args.dsn) as conn:
+            dhtRollups.install(conn)
+            dhtRollups.backfill(conn, "-infinity")
+        with psycopg.connect(args.dsn, autocommit=True) as conn:
+            for _, table in dhtStorage.ROLLUPS:
+                conn.execute(f"ANALYZE {table}")
+            for period, _, num in periods:
+                bucket_seconds = dhtBucket.period_seconds(period)
+                start = dhtBucket.window_start(bucket_seconds, int(num))
+                end = start + int(num) * bucket_seconds
+                times = []
+                for use in (False, True):
+                    if use and dhtStorage.rollup_for(bucket_seconds) is None:
+                        times.append(None)
+                        continue
+                    sql, params = store.bucket_query(bucket_seconds, start, end, BENCH_HOSTS, use)
+                    times.append(median_ms(lambda: conn.execute(sql, params).fetchall(), args.repeat))
+                raw, rolled = times
+                rolled = "-" if rolled is None else f"{rolled:.1f}"
+                print(f"{have:<11} {period + '/' + num:<16} {raw:>7.1f}   {rolled:>9}")
+    return 0
+
+
+def engine(args):
+    # Each store's bucket_aggregate against NumpyEngine over it
+    import dhtAggregate
+
+    end = int(time.time())
+    periods = [item.partition("/") for item in args.periods.split(",")]
+    with tempfile.TemporaryDirectory(prefix="dhtbench") as scratch:
+        if args.dsn:
+            have = bench_rows(args.dsn)
+            if have is None:
+                return 1
+            # Raw GROUP BY, not the rollup tables
+            stores = [("postgres", dhtStorage.PostgresStore(args.dsn, rollups=False))]
+            hosts = BENCH_HOSTS
+        else:
+            stores = [
+                ("sqlite", dhtStorage.SqliteStore(os.path.join(scratch, "dht.db"))),
+                ("sqlite-monthly", dhtStorage.SqliteStore(os.path.join(scratch, "months"), layout="monthly")),
+            ]
+            hosts = dhtBucket.HOSTS
+        rows = []
+        if not args.dsn or not have:
+            print(f"Seeding {args.days} days of readings")
+            rows = synthetic_rows(args.days, end=end, hosts=hosts)
+        print("store            period           sql ms   numpy ms")
+        for label, store in stores:
+            store.open()
+            seed(store, rows)
+            numpy_engine = dhtAggregate.NumpyEngine(store)
+            for period, _, num in periods:
+                bucket_seconds = dhtBucket.period_seconds(period)
+                start = dhtBucket.window_start(bucket_seconds, int(num), end)
+                stop = start + int(num) * bucket_seconds
+                sql, numpy = (
+                    median_ms(lambda: s.bucket_aggregate(bucket_seconds, start, stop, hosts), args.repeat)
+                    for s in (store, numpy_engine)
+                )
+                print(f"{label:<16} {period + '/' + num:<16} {sql:>7.1f}   {numpy:>8.1f}")
+            store.close()
+    return 0
+
+
+async def wait_up(url, proc, seconds=30):
+    import httpx
+
+    stop = time.monotonic() + seconds
+    async with httpx.AsyncClient(base_url=url, timeout=2) as client:
+        while time.monotonic() < stop and proc.poll() is None:
+            try:
+                await client.get("/latest")
+                return True
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    return False
+
+
+async def workers(args):
+    # One relay for all runs; a fresh uvicorn per worker count. Without MQTT
+    # traffic the relay only serves its (empty) state, which is all /latest
+    # and /bucket need here.
+    import httpx
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    url = f"http://127.0.0.1:{args.port}"
+    paths = args.paths.split(",")
+    with tempfile.TemporaryDirectory(prefix="dhtbench") as scratch:
+        env = dict(os.environ, DHT_INGEST="socket", DHT_INGEST_SOCKET=os.path.join(scratch, "ingest.sock"))
+        if "DHT_BACKEND" not in env:
+            env["DHT_BACKEND"] = "sqlite"
+            env["DHT_DB"] = os.path.join(scratch, "dht.db")
+            store = dhtStorage.SqliteStore(env["DHT_DB"])
+            store.open()
+            print(f"Seeding {args.days} days of readings")
+            seed(store, synthetic_rows(args.days))
+            store.close()
+        if args.no_cache:
+            env["BUCKET_CACHE_BYTES"] = "0"
+        relay = subprocess.Popen([sys.executable, "dhtIngest.py"], cwd=here, env=env)
+        rates = {}
+        try:
+            for n in (int(w) for w in args.workers.split(",")):
+                server = subprocess.Popen(
+                    [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port", str(args.port),
+                     "--workers", str(n), "--log-level", "warning", "dhtServer:app"],
+                    cwd=here, env=env,
+                )
+                try:
+                    if not await wait_up(url, server):
+                        print(f"{n} workers: server did not come up", file=sys.stderr)
+                        return 1
+                    limits = httpx.Limits(max_connections=args.concurrency)
+                    async with httpx.AsyncClient(base_url=url, timeout=30, limits=limits) as client:
+                        for path in paths:
+                            latencies, errors = await hammer(client, [path], args.concurrency, args.seconds)
+                            rates[n, path] = report(f"{n} workers {path}", latencies, errors, args.seconds)
+                finally:
+                    server.terminate()
+                    server.wait()
+        finally:
+            relay.terminate()
+            relay.wait()
+    first = min(n for n, _ in rates)
+    for (n, path), rate in sorted(rates.items()):
+        base = rates[first, path]
+        scale = f"{rate / base:.2f}x" if base else "-"
+        print(f"{path} with {n} workers: {scale} of {first}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Web server benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("load", help="requests/s for one path")
+    p.add_argument("--url", help="running server, e.g. http://127.0.0.1:8071; in-process app if omitted")
+    p.add_argument("--path", default="/bucket/1hours/24")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--seconds", type=float, default=10)
+    p.add_argument("--days", type=int, default=30, help="synthetic days to seed the in-process store with")
+    p.add_argument("--no-cache", action="store_true", help="disable the /bucket response cache")
+
+    p = sub.add_parser("rollups", help="raw vs rollup bucket queries as iso.dht grows (Postgres)")
+    p.add_argument("--dsn", required=True, help="a scratch database; iso.dht there is filled with synthetic rows")
+    p.add_argument("--rows", default="1e6,1e7,1e8", help="row counts to measure at")
+    p.add_argument("--periods", default="1minutes/60,1hours/24,1days/30")
+    p.add_argument("--repeat", type=int, default=5)
+
+    p = sub.add_parser("engine", help="SQL vs NumPy bucket aggregation")
+    p.add_argument("--dsn", help="scratch Postgres database; local SQLite files if omitted")
+    p.add_argument("--days", type=int, default=90, help="synthetic days to seed with")
+    p.add_argument("--periods", default="15minutes/96,1hours/168,1days/90")
+    p.add_argument("--repeat", type=int, default=5)
+
+    p = sub.add_parser("workers", help="requests/s as uvicorn workers are added (needs uvicorn)")
+    p.add_argument("--workers", default="1,2,4", help="worker counts to run")
+    p.add_argument("--port", type=int, default=8091)
+    p.add_argument("--paths", default="/latest,/bucket/1hours/24")
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--seconds", type=float, default=10)
+    p.add_argument("--days", type=int, default=30, help="synthetic days to seed the scratch store with")
+    p.add_argument("--no-cache", action="store_true", help="disable the /bucket response cache")
+
+    args = parser.parse_args(argv)
+    if args.command == "load":
+        return asyncio.run(load(args))
+    if args.command == "rollups":
+        return rollups(args)
+    if args.command == "engine":
+        return engine(args)
+    if args.command == "workers":
+        return asyncio.run(workers(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import os
+import re
+import sys
+import json
+import time
+import struct
+import argparse
+
+import dhtStorage
+from dhtStorage import TEMP_SUM, HUM_SUM, avg
+
+HOST_IN = "10.0.0.32"
+HOST_OUT = "10.0.0.31"
+HOSTS = [HOST_IN, HOST_OUT]
+
+# /bucket.bin layout (little endian), for clients too small to parse JSON:
+#   header     16 bytes, see BIN_HEADER
+#   age        uint16[n]  buckets before the open one (0 = open bucket)
+#   in_temp    int16[n]   fixed point, value * scale, BIN_MISSING if NULL
+#   in_hum     int16[n]
+#   out_temp   int16[n]
+#   out_hum    int16[n]
+# Rows are newest first, like the JSON shapes.
+BIN_MAGIC = b"DHTB"
+BIN_VERSION = 1
+BIN_SCALE = 100
+BIN_MISSING = -32768
+BIN_HEADER = struct.Struct("<4sBBHII")  # magic, version, scale, n, bucket seconds, open bucket start
+BIN_MAX_ROWS = 0xFFFF
+
+# Last second a datetime can hold (9999-12-31 23:59:59 UTC); the stores
+# convert bucket bounds to datetimes
+MAX_TS = 253402300799
+
+
+# /bucket period units, in seconds
+PERIOD_UNITS = {
+    "min": 60,
+    "mins": 60,
+    "minute": 60,
+    "minutes": 60,
+    "hour": 3600,
+    "hours": 3600,
+    "day": 86400,
+    "days": 86400,
+    "week": 604800,
+    "weeks": 604800,
+    "month": 2592000,  # 30 days
+    "months": 2592000,  # 30 days
+}
+
+
+def period_seconds(period):
+    # "<number><unit>" -> bucket seconds, default unit = minutes; ValueError
+    # with a message fit for the client otherwise
+    period = period.strip().lower()
+    i = 0
+    while i < len(period) and period[i].isdigit():
+        i += 1
+    if i == 0:
+        raise ValueError("period must start with a number")
+    unit = period[i:] or "minutes"
+    if unit not in PERIOD_UNITS:
+        raise ValueError(f"unsupported unit '{unit}'")
+    seconds = int(period[:i]) * PERIOD_UNITS[unit]
+    if seconds < 1:
+        raise ValueError("period must be at least 1")
+    return seconds
+
+
+def window_start(bucket_seconds, num, now=None):
+    # Start of the oldest of the `num` newest buckets (the newest is still
+    # open), no earlier than the epoch: there are no readings before it, and
+    # the stores can't convert a time before year 1
+    if now is None:
+        now = time.time()
+    return max(0, (int(now // bucket_seconds) - (num - 1)) * bucket_seconds)
+
+
+def check_period(bucket_seconds, now=None):
+    # ValueError, with a message fit for the client, if the open bucket ends
+    # past MAX_TS
+    if now is None:
+        now = time.time()
+    if (int(now // bucket_seconds) + 1) * bucket_seconds > MAX_TS:
+        raise ValueError("period too large")
+
+
+def in_closed_window(bucket_seconds, num, ts, now=None):
+    # Whether ts falls in one of the closed buckets among the `num` newest,
+    # i.e. a reading that arrived after its bucket was served as final
+    if now is None:
+        now = time.time()
+    return window_start(bucket_seconds, num, now) <= ts < now // bucket_seconds * bucket_seconds
+
+
+def pivot_row(bucket_start, by_host):
+    # One /bucket row from {host: agg}:
+    # (bucket_start, in_temp, in_humidity, out_temp, out_humidity)
+    i = by_host.get(HOST_IN)
+    o = by_host.get(HOST_OUT)
+    return (
+        bucket_start,
+        avg(i, TEMP_SUM),
+        avg(i, HUM_SUM),
+        avg(o, TEMP_SUM),
+        avg(o, HUM_SUM),
+    )
+
+
+def pivot(rows):
+    # bucket_aggregate rows (newest first) -> /bucket rows (newest first)
+    buckets = {}
+    for r in rows:
+        buckets.setdefault(r[0], {})[r[1]] = r[2:]
+    return [pivot_row(b, buckets[b]) for b in sorted(buckets, reverse=True)]
+
+
+def bin_fixed(v):
+    if v is None:
+        return BIN_MISSING
+    return max(-32767, min(32767, int(round(v * BIN_SCALE))))
+
+
+def bin_columns(rows, bucket_seconds, open_start):
+    # Packed arrays for /bucket rows, one bytes chunk per array so chunks for
+    # consecutive runs of rows can be concatenated
+    n = len(rows)
+    ages = struct.pack("<%dH" % n, *[int((open_start - r[0]) // bucket_seconds) for r in rows])
+    return (ages,) + tuple(
+        struct.pack("<%dh" % n, *[bin_fixed(r[i]) for r in rows]) for i in range(1, 5)
+    )
+
+
+def bin_body(bucket_seconds, open_start, *parts):
+    # Header plus the bin_columns parts, newest first
+    n = sum(len(p[0]) for p in parts) // 2
+    header = BIN_HEADER.pack(BIN_MAGIC, BIN_VERSION, BIN_SCALE, n, bucket_seconds, int(open_start))
+    return header + b"".join(b"".join(chunks) for chunks in zip(*parts))
+
+
+def index_conds(plan):
+    # Index Cond of a scan node and of the bitmap index scans feeding it
+    conds = [plan["Index Cond"]] if "Index Cond" in plan else []
+    for child in plan.get("Plans", []):
+        if child.get("Node Type", "").startswith("Bitmap"):
+            conds.extend(index_conds(child))
+    return conds
+
+
+def unbounded_scans(plan, columns):
+    # Walk an EXPLAIN (FORMAT JSON) plan for scans of the relations in
+    # `columns` (relation -> its time column) that are not index ranges on
+    # that column: a Seq Scan, or an index scan bounded by host alone, which
+    # reads every row the host ever had
+    found = []
+    relation = plan.get("Relation Name")
+    if relation in columns:
+        column = columns[relation]
+        if plan["Node Type"] == "Seq Scan":
+            found.append(f"seq scan on {relation}")
+        elif not any(re.search(rf"\b{column}\b", cond) for cond in index_conds(plan)):
+            found.append(f"{plan['Node Type'].lower()} on {relation} without a {column} range")
+    for child in plan.get("Plans", []):
+        found.extend(unbounded_scans(child, columns))
+    return found
+
+
+def explain_check(store, bucket_seconds, num):
+    # Planner still picks a Seq Scan with enable_seqscan off when no index path
+    # exists, so this catches a regression even on a tiny test table
+    columns = {"dht": "ts"} | {t.split(".")[1]: "bucket_start" for _, t in dhtStorage.ROLLUPS}
+    start = window_start(bucket_seconds, num)
+    end = start + num * bucket_seconds
+    failures = []
+    with store.pool.connection() as conn:
+        conn.execute("SET enable_seqscan = off")
+        for rollups in (False, True):
+            if rollups and dhtStorage.rollup_for(bucket_seconds) is None:
+                continue
+            sql, params = store.bucket_query(bucket_seconds, start, end, HOSTS, rollups)
+            plan = conn.execute("EXPLAIN (FORMAT JSON) " + sql, params).fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans = unbounded_scans(plan[0]["Plan"], columns)
+            label = "rollup" if rollups else "raw"
+            if scans:
+                failures.append(f"{label}: {', '.join(scans)}")
+            else:
+                print(f"{label}: ok")
+        conn.execute("RESET enable_seqscan")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check that /bucket queries stay bounded index scans"
+    )
+    parser.add_argument("command", choices=["index", "explain"])
+    parser.add_argument("--dsn", default=os.environ.get("PSQL_DSN"))
+    parser.add_argument("--seconds", type=int, default=3600)
+    parser.add_argument("--num", type=int, default=24)
+    args = parser.parse_args(argv)
+    if not args.dsn:
+        parser.error("--dsn or PSQL_DSN is required")
+
+    store = dhtStorage.PostgresStore(args.dsn, rollups=False)
+    if args.command == "index":
+        store.ensure_index()
+        return 0
+
+    store.pool.open()
+    try:
+        failures = explain_check(store, args.seconds, args.num)
+    finally:
+        store.close()
+    for f in failures:
+        print("FAIL", f)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import asyncio
+from datetime import datetime
+
+import aiomqtt
+
+import dhtPayload
+from dhtOpenBuckets import OpenBuckets
+
+MQTT_HOST = os.environ.get("MQTT_HOST", "mqtt.lan")
+MQTT_PORT = int(os.environ.get("MQTT_PORT", "1883"))
+MEASUREMENT_TOPIC = "dht_sensor_measurement"
+# LCD config (metric/period/count); dhtServer learns bucket update
+# subscriptions from it
+LCD_CONTROL_TOPIC = "dht_sensor_lcd_control"
+MQTT_TOPICS = [MEASUREMENT_TOPIC, dhtPayload.BIN_TOPIC, LCD_CONTROL_TOPIC]
+INGEST_SOCKET = os.environ.get("DHT_INGEST_SOCKET", "/tmp/dht_ingest.sock")
+# Relay clients with more than this many bytes unsent are dropped
+MAX_CLIENT_BACKLOG = 256 * 1024
+# Bucket sizes the relay and workers keep open aggregates for from the start,
+# so the open /bucket row needs no DB query; workers add more with "track"
+# requests, up to MAX_OPEN_BUCKETS sizes in all (see OpenBuckets)
+OPEN_BUCKETS = [int(s) for s in os.environ.get("DHT_OPEN_BUCKETS", "60,900,3600,86400").split(",") if s]
+MAX_OPEN_BUCKETS = int(os.environ.get("DHT_OPEN_BUCKETS_MAX", "16"))
+# Relay line carrying its cached state; "$" topics are reserved by MQTT, so
+# it never collides with a sensor topic
+STATE_TOPIC = "$state"
+# Longest relay line a worker accepts; the STATE_TOPIC line grows with the
+# hosts and tracked bucket sizes, well past asyncio's 64 KiB default
+RELAY_LINE_LIMIT = int(os.environ.get("DHT_RELAY_LINE_LIMIT", str(16 * 1024 * 1024)))
+
+
+def received_at(ts=None):
+    # The "at" stamp put on every reading: when it was measured if known,
+    # else now
+    when = datetime.now() if ts is None else datetime.fromtimestamp(ts)
+    return when.strftime("%Y/%m/%d, %H:%M:%S")
+
+
+class MqttLink:
+    # The broker session: payloads() yields (topic, payload) forever,
+    # reconnecting with backoff, and publish() sends on the same session
+    def __init__(self, host=MQTT_HOST, port=MQTT_PORT, topics=MQTT_TOPICS):
+        self.host = host
+        self.port = port
+        self.topics = topics
+        self.client = None
+
+    async def payloads(self):
+        delay = 1
+        while True:
+            try:
+                async with aiomqtt.Client(self.host, self.port, keepalive=60) as client:
+                    print("Connected to", self.host)
+                    for topic in self.topics:
+                        await client.subscribe(topic)
+                    self.client = client
+                    delay = 1
+                    async for message in client.messages:
+                        yield str(message.topic), bytes(message.payload)
+            except aiomqtt.MqttError as e:
+                print(f"MQTT error: {e}; reconnecting in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                self.client = None
+
+    async def publish(self, topic, payload, retain=False):
+        # Dropped while disconnected; publishers resend whole state anyway
+        if self.client is None:
+            return False
+        try:
+            await self.client.publish(topic, payload, retain=retain)
+        except aiomqtt.MqttError as e:
+            print(f"MQTT publish to {topic} failed: {e}")
+            return False
+        return True
+
+
+class RelayLink:
+    # Worker end of the Relay socket. Lines from the relay are one
+    # message each, topic, a space, then the payload; payloads() yields them
+    # like MqttLink.payloads does. The relay starts every connection with a
+    # STATE_TOPIC line holding the latest readings and open bucket
+    # aggregates, so a worker that starts or reconnects late is warm at once.
+    def __init__(self, path=INGEST_SOCKET, limit=RELAY_LINE_LIMIT, tracked=()):
+        self.path = path
+        self.limit = limit
+        self.writer = None
+        # Bucket sizes to ask for again on reconnect, e.g. the worker's
+        # OpenBuckets.sizes
+        self.tracked = tracked
+
+    def track(self, bucket_seconds):
+        # Ask the relay to keep open aggregates for another bucket size; it
+        # answers with a STATE_TOPIC line. Call from the event loop.
+        if self.writer is not None:
+            self.writer.write(b"track %d\n" % bucket_seconds)
+
+    async def payloads(self):
+        delay = 1
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=self.limit)
+            except OSError as e:
+                print(f"Ingest socket {self.path}: {e}; retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+            print("Connected to ingest socket", self.path)
+            delay = 1
+            self.writer = writer
+            for bucket_seconds in list(self.tracked):
+                writer.write(b"track %d\n" % bucket_seconds)
+            try:
+                while line := await reader.readline():
+                    topic, _, payload = line.rstrip(b"\n").partition(b" ")
+                    yield topic.decode(), payload
+                print("Ingest socket closed; reconnecting")
+            except (OSError, ValueError) as e:
+                # ValueError: a line over the limit
+                print(f"Ingest socket {self.path}: {e}; reconnecting in {delay}s")
+                await asyncio.sleep(delay)
+            finally:
+                self.writer = None
+                writer.close()
+
+
+async def feed(payloads, queue):
+    # Pump a payload source into the app's queue, dropping when it is full
+    async for item in payloads:
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            print("Ingest queue full; dropping", item[0])
+
+
+async def supervise(name, start, delay=1):
+    # Run the coroutine start() makes, starting it again whenever it ends or
+    # fails, so one bad message can't silently stop ingest for the process
+    while True:
+        try:
+            await start()
+            print(f"{name} ended; restarting in {delay}s")
+        except Exception as e:
+            print(f"{name} failed: {e!r}; restarting in {delay}s")
+        await asyncio.sleep(delay)
+
+
+def encode_line(topic, payload):
+    # JSON payloads can't contain a raw newline, but never trust the wire
+    return topic.encode() + b" " + payload.replace(b"\n", b" ") + b"\n"
+
+
+class Relay:
+    # Single MQTT subscriber relaying every message to all connected HTTP
+    # workers, so N workers cost one broker session. It also keeps the live
+    # state each worker would otherwise build on its own: the latest reading
+    # per host and the open bucket aggregates.
+    def __init__(self, path=INGEST_SOCKET, sizes=OPEN_BUCKETS):
+        self.path = path
+        self.clients = set()
+        self.latest = {}
+        self.open_buckets = OpenBuckets(sizes, MAX_OPEN_BUCKETS)
+
+    def state_line(self, sizes=None):
+        state = {"latest": self.latest, "open_buckets": self.open_buckets.export(sizes)}
+        return encode_line(STATE_TOPIC, json.dumps(state, separators=(",", ":")).encode())
+
+    def apply(self, topic, payload):
+        if topic != MEASUREMENT_TOPIC:
+            return
+        try:
+            batch = dhtPayload.readings(json.loads(payload))
+            for d in batch:
+                self.open_buckets.add(d["host"], d.get("temp"), d.get("hum"), d["ts"])
+            d = batch[-1]
+            d["at"] = received_at(d["ts"])
+            self.latest[d["host"]] = d
+        except (ValueError, KeyError, TypeError) as e:
+            print("Bad message:", e)
+
+    async def on_client(self, reader, writer):
+        self.clients.add(writer)
+        writer.write(self.state_line())
+        try:
+            while line := await reader.readline():
+                command, _, arg = line.decode().partition(" ")
+                if command == "track" and arg.strip().isdigit():
+                    bucket_seconds = int(arg)
+                    self.open_buckets.track(bucket_seconds)
+                    writer.write(self.state_line({bucket_seconds}))
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def send(self, line):
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BACKLOG:
+                print("Dropping slow ingest client")
+                self.clients.discard(writer)
+                writer.close()
+                continue
+            writer.write(line)
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        server = await asyncio.start_unix_server(self.on_client, self.path)
+        print("Ingest relay listening on", self.path)
+        async with server:
+            async for topic, payload in MqttLink().payloads():
+                if topic == dhtPayload.BIN_TOPIC:
+                    # Relayed as JSON: workers then see one format, and the
+                    # line protocol stays text
+                    try:
+                        payload = json.dumps(dhtPayload.unpack(payload), separators=(",", ":")).encode()
+                    except ValueError as e:
+                        print("Bad message:", e)
+                        continue
+                    topic = MEASUREMENT_TOPIC
+                self.apply(topic, payload)
+                self.send(encode_line(topic, payload))
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(Relay().serve()))
@@ -0,0 +1,48 @@
+import json
+import time
+
+# JSON encoding for the hot endpoints. orjson is used when installed (it is
+# several times faster and emits compact bytes directly); otherwise the stdlib
+# with the same compact separators.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# /bucket fields, in pivot row order
+COLUMNS = ("at", "in_temp", "in_humidity", "out_temp", "out_humidity")
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def at_text(epoch):
+    # Local time, like the rest of the UI
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(epoch))
+
+
+def rows_body(rows):
+    # Default /bucket shape: [{"at": ..., "in_temp": ..., ...}, ...]
+    return dumps([dict(zip(COLUMNS, (at_text(r[0]),) + tuple(r[1:]))) for r in rows])
+
+
+def column_fragments(rows):
+    # The comma-separated contents of each column array, so cached closed
+    # buckets and the open bucket can be spliced without re-encoding
+    if not rows:
+        return (b"",) * len(COLUMNS)
+    cols = list(zip(*rows))
+    cols[0] = [at_text(t) for t in cols[0]]
+    return tuple(dumps(c)[1:-1] for c in cols)
+
+
+def columns_body(*parts):
+    # ?shape=columns: {"at": [...], "in_temp": [...], ...} from column_fragments
+    # results, newest first
+    fields = []
+    for name, frags in zip(COLUMNS, zip(*parts)):
+        fields.append(b'"%s":[%s]' % (name.encode(), b",".join(f for f in frags if f)))
+    return b"{" + b",".join(fields) + b"}"
@@ -0,0 +1,46 @@
+import time
+from collections import namedtuple
+from threading import Lock
+from types import MappingProxyType
+
+import dhtJson
+
+# Immutable view of the latest readings. `body` is the pre-rendered /latest
+# JSON and `etag` changes whenever a reading arrives.
+Snapshot = namedtuple("Snapshot", "version readings body etag")
+
+
+class LatestStore:
+    # Written by the MQTT thread, read by request handlers. Writers build a
+    # complete new Snapshot under the lock and publish it with one attribute
+    # assignment, so readers never lock and never see a half-updated dict.
+    def __init__(self, source_map):
+        self.source_map = source_map
+        self.lock = Lock()
+        self.readings = {}
+        # Distinguishes versions across restarts so old ETags never match
+        self.boot = int(time.time())
+        self.snapshot = self._render(0)
+
+    def update(self, host, reading):
+        with self.lock:
+            self.readings[host] = dict(reading, source=host)
+            self.snapshot = self._render(self.snapshot.version + 1)
+            return self.snapshot
+
+    def _render(self, version):
+        # Keyed by sourceMap name ("in"/"out") where known, else by host
+        d = {self.source_map.get(k, k): v for k, v in self.readings.items()}
+        body = dhtJson.dumps(d)
+        view = MappingProxyType({k: MappingProxyType(v) for k, v in d.items()})
+        return Snapshot(version, view, body, f'"{self.boot}-{version}"')
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
@@ -0,0 +1,105 @@
+import time
+from threading import Lock
+
+from dhtBucket import pivot_row
+from dhtStorage import TEMP_SUM, HUM_SUM, new_agg, add_value
+
+
+class OpenBuckets:
+    # Running sum/count/min/max per host for the still-open bucket of every
+    # bucket size that has been asked for, fed from the MQTT stream.
+    #
+    # A bucket size is only trusted once it has been tracked since before the
+    # current bucket started; until then the server was not listening for the
+    # whole bucket and row() says so by returning None.
+    #
+    # `sizes` are tracked from the start and always kept. Clients choose the
+    # other sizes, so at most max_sizes are tracked in all, the least recently
+    # asked for given up first; row() is None for an untracked size and the
+    # caller reads the database instead.
+    def __init__(self, sizes=(), max_sizes=16):
+        self.lock = Lock()
+        self.sizes = {}  # bucket_seconds -> [since, start, {host: agg}], oldest use first
+        self.pinned = set(sizes)
+        self.max_sizes = max_sizes
+        for bucket_seconds in sizes:
+            self.track(bucket_seconds)
+
+    def track(self, bucket_seconds, now=None):
+        # True the first time a size is seen (again, if it was given up)
+        if now is None:
+            now = time.time()
+        with self.lock:
+            state = self.sizes.pop(bucket_seconds, None)
+            if state is not None:
+                self.sizes[bucket_seconds] = state
+                return False
+            if bucket_seconds not in self.pinned and len(self.sizes) >= self.max_sizes:
+                unpinned = [bs for bs in self.sizes if bs not in self.pinned]
+                if not unpinned:
+                    return False
+                del self.sizes[unpinned[0]]
+            start = now // bucket_seconds * bucket_seconds
+            self.sizes[bucket_seconds] = [now, start, {}]
+            return True
+
+    def add(self, host, temp, hum, ts=None):
+        if ts is None:
+            ts = time.time()
+        with self.lock:
+            for bucket_seconds, state in self.sizes.items():
+                start = ts // bucket_seconds * bucket_seconds
+                if start > state[1]:
+                    state[1] = start
+                    state[2] = {}
+                elif start < state[1]:
+                    # Late reading for a bucket that has already closed
+                    continue
+                agg = state[2].get(host)
+                if agg is None:
+                    agg = state[2][host] = new_agg()
+                add_value(agg, TEMP_SUM, temp)
+                add_value(agg, HUM_SUM, hum)
+
+    def export(self, sizes=None):
+        # JSON-able copy of the state, for handing to another process
+        with self.lock:
+            return {
+                bs: [since, start, {h: list(a) for h, a in by_host.items()}]
+                for bs, (since, start, by_host) in self.sizes.items()
+                if sizes is None or bs in sizes
+            }
+
+    def load(self, state):
+        # Adopt exported state for every size we track that it has tracked
+        # for longer; JSON turns the bucket sizes into strings
+        with self.lock:
+            for bs, (since, start, by_host) in state.items():
+                bs = int(bs)
+                mine = self.sizes.get(bs)
+                if mine is not None and since < mine[0]:
+                    self.sizes[bs] = [since, start, {h: list(a) for h, a in by_host.items()}]
+
+    def aggregates(self, bucket_seconds, now=None):
+        # (bucket_start, {host: agg}) for the open bucket, or None if unknown
+        if now is None:
+            now = time.time()
+        current = now // bucket_seconds * bucket_seconds
+        with self.lock:
+            state = self.sizes.get(bucket_seconds)
+            if state is None or state[0] > current:
+                return None
+            if state[1] != current:
+                return current, {}
+            return current, {h: list(a) for h, a in state[2].items()}
+
+    def row(self, bucket_seconds, now=None):
+        # Open bucket in the /bucket row shape: None when unknown, () when the
+        # bucket has no readings yet
+        aggs = self.aggregates(bucket_seconds, now)
+        if aggs is None:
+            return None
+        start, by_host = aggs
+        if not by_host:
+            return ()
+        return pivot_row(start, by_host)
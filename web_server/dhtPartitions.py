@@ -0,0 +1 @@
+../common/dhtPartitions.py
\ No newline at end of file
@@ -0,0 +1,124 @@
+import time
+import asyncio
+
+from dhtBucket import in_closed_window
+
+# Chart history pushed to the LCDs over MQTT, one topic per subscription:
+#   dht_bucket_update/<bucket seconds>/<count>
+# Payloads are /bucket.bin bodies (see dhtBucket.BIN_HEADER).
+BUCKET_UPDATE_TOPIC = "dht_bucket_update"
+# Largest count published; the LCD's bucket ring holds this many
+MAX_COUNT = 160
+# Retry delay for a full series that could not be rendered or sent
+RETRY = 30
+
+
+def update_topic(bucket_seconds, count):
+    return f"{BUCKET_UPDATE_TOPIC}/{bucket_seconds}/{count}"
+
+
+class BucketPublisher:
+    # For every subscribed (bucket seconds, count):
+    #   - when a bucket closes, the full series, retained, so a display that
+    #     (re)connects gets its whole chart straight from the broker
+    #   - on every reading, only the open bucket, not retained
+    #
+    # render(bucket_seconds, count, since) builds a payload like GET
+    # /bucket.bin?since=; publish(topic, payload, retain) sends it and returns
+    # False if it could not.
+    #
+    # Pinned subscriptions (the server's own config) are always kept. Any
+    # client on the broker can ask for others, so like OpenBuckets at most
+    # max_subs are kept in all, the least recently asked for given up first,
+    # and one not asked for again within ttl seconds is given up too, except
+    # the newest. A display's retained config is asked for again whenever
+    # the server reconnects to the broker.
+    def __init__(self, render, publish, settle=5, max_subs=8, ttl=7 * 86400):
+        self.render = render
+        self.publish = publish
+        # Seconds after a close before reading the closed bucket back, so the
+        # logger has stored its last readings
+        self.settle = settle
+        self.max_subs = max_subs
+        self.ttl = ttl
+        self.subs = {}  # sub -> when it was last asked for, oldest first
+        self.pinned = set()
+        self.due = {}  # sub -> when its next full series is due
+        self.wake = asyncio.Event()
+
+    def subscribe(self, bucket_seconds, count, pinned=False, now=None):
+        if now is None:
+            now = time.time()
+        sub = (bucket_seconds, max(1, min(count, MAX_COUNT)))
+        if pinned:
+            self.pinned.add(sub)
+        new = self.subs.pop(sub, None) is None
+        if new and sub not in self.pinned and len(self.subs) >= self.max_subs:
+            unpinned = [s for s in self.subs if s not in self.pinned]
+            if not unpinned:
+                return
+            self._drop(unpinned[0])
+        self.subs[sub] = now
+        self.expire(now)
+        if new:
+            print("Publishing", update_topic(*sub))
+            # run() sends the full series for it right away
+            self.wake.set()
+
+    def expire(self, now=None):
+        # Give up unpinned subscriptions not asked for within ttl, but the newest
+        if now is None:
+            now = time.time()
+        for sub in list(self.subs)[:-1]:
+            if sub not in self.pinned and self.subs[sub] < now - self.ttl:
+                self._drop(sub)
+
+    def _drop(self, sub):
+        print("No longer publishing", update_topic(*sub))
+        del self.subs[sub]
+        self.due.pop(sub, None)
+
+    async def on_reading(self):
+        now = time.time()
+        for bucket_seconds, count in list(self.subs):
+            open_start = now // bucket_seconds * bucket_seconds
+            body = await self.render(bucket_seconds, count, open_start)
+            await self.publish(update_topic(bucket_seconds, count), body, False)
+
+    def on_late(self, ts):
+        # A reading for a bucket that has already closed (a node replaying
+        # its buffer): the retained series holding it is stale, send it
+        # again once the logger has stored the reading
+        now = time.time()
+        for sub in self.subs:
+            if in_closed_window(*sub, ts, now):
+                self.due[sub] = min(self.due.get(sub, now), now + self.settle)
+                self.wake.set()
+
+    async def run(self):
+        due = self.due
+        while True:
+            now = time.time()
+            self.expire(now)
+            for sub in self.subs:
+                due.setdefault(sub, now)
+            for sub, at in list(due.items()):
+                if at > now:
+                    continue
+                bucket_seconds, count = sub
+                try:
+                    body = await self.render(bucket_seconds, count, None)
+                    sent = await self.publish(update_topic(*sub), body, True)
+                except Exception as e:
+                    print("Bucket update for", update_topic(*sub), "failed:", e)
+                    sent = False
+                if sent:
+                    due[sub] = (now // bucket_seconds + 1) * bucket_seconds + self.settle
+                else:
+                    due[sub] = now + RETRY
+            self.wake.clear()
+            timeout = max(0, min(due.values()) - time.time()) if due else None
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
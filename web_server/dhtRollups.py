@@ -0,0 +1,145 @@
+import os
+import sys
+import math
+import argparse
+
+# The rollup tables are read by dhtStorage.PostgresStore
+from dhtStorage import ROLLUPS
+
+ROLLUP_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {table} (
+  host text NOT NULL,
+  bucket_start timestamptz NOT NULL,
+  temp_sum double precision NOT NULL DEFAULT 0,
+  temp_count bigint NOT NULL DEFAULT 0,
+  temp_min real,
+  temp_max real,
+  hum_sum double precision NOT NULL DEFAULT 0,
+  hum_count bigint NOT NULL DEFAULT 0,
+  hum_min real,
+  hum_max real,
+  PRIMARY KEY (host, bucket_start)
+);
+"""
+
+# One upsert per rollup, run from the iso.dht insert trigger
+ROLLUP_UPSERT_SQL = """
+  INSERT INTO {table} AS r
+    (host, bucket_start, temp_sum, temp_count, temp_min, temp_max,
+     hum_sum, hum_count, hum_min, hum_max)
+  VALUES (
+    NEW.host,
+    to_timestamp(floor(extract(epoch FROM NEW.ts) / {seconds}) * {seconds}),
+    coalesce(NEW.temp, 0), (NEW.temp IS NOT NULL)::int, NEW.temp, NEW.temp,
+    coalesce(NEW.hum, 0), (NEW.hum IS NOT NULL)::int, NEW.hum, NEW.hum
+  )
+  ON CONFLICT (host, bucket_start) DO UPDATE SET
+    temp_sum = r.temp_sum + EXCLUDED.temp_sum,
+    temp_count = r.temp_count + EXCLUDED.temp_count,
+    temp_min = LEAST(r.temp_min, EXCLUDED.temp_min),
+    temp_max = GREATEST(r.temp_max, EXCLUDED.temp_max),
+    hum_sum = r.hum_sum + EXCLUDED.hum_sum,
+    hum_count = r.hum_count + EXCLUDED.hum_count,
+    hum_min = LEAST(r.hum_min, EXCLUDED.hum_min),
+    hum_max = GREATEST(r.hum_max, EXCLUDED.hum_max);
+"""
+
+ROLLUP_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION iso.dht_rollup_insert() RETURNS trigger AS $$
+BEGIN
+{upserts}
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS dht_rollup_insert ON iso.dht;
+CREATE TRIGGER dht_rollup_insert AFTER INSERT ON iso.dht
+  FOR EACH ROW EXECUTE FUNCTION iso.dht_rollup_insert();
+"""
+
+# Recompute a rollup from raw rows, replacing whatever is there. The start
+# must be a bucket boundary of the rollup, or the first bucket is rebuilt
+# from only part of its rows.
+ROLLUP_BACKFILL_SQL = """
+INSERT INTO {table}
+  (host, bucket_start, temp_sum, temp_count, temp_min, temp_max,
+   hum_sum, hum_count, hum_min, hum_max)
+SELECT
+  host,
+  to_timestamp(floor(extract(epoch FROM ts) / {seconds}) * {seconds}) AS b,
+  coalesce(SUM(temp), 0), COUNT(temp), MIN(temp), MAX(temp),
+  coalesce(SUM(hum), 0), COUNT(hum), MIN(hum), MAX(hum)
+FROM iso.dht
+WHERE ts >= to_timestamp(%s)
+GROUP BY host, b
+ON CONFLICT (host, bucket_start) DO UPDATE SET
+  temp_sum = EXCLUDED.temp_sum,
+  temp_count = EXCLUDED.temp_count,
+  temp_min = EXCLUDED.temp_min,
+  temp_max = EXCLUDED.temp_max,
+  hum_sum = EXCLUDED.hum_sum,
+  hum_count = EXCLUDED.hum_count,
+  hum_min = EXCLUDED.hum_min,
+  hum_max = EXCLUDED.hum_max;
+"""
+
+def install(conn):
+    with conn.cursor() as cur:
+        for _, table in ROLLUPS:
+            cur.execute(ROLLUP_TABLE_SQL.format(table=table))
+        upserts = "".join(
+            ROLLUP_UPSERT_SQL.format(table=table, seconds=seconds)
+            for seconds, table in ROLLUPS
+        )
+        cur.execute(ROLLUP_TRIGGER_SQL.format(upserts=upserts))
+    conn.commit()
+
+
+def bucket_floor(epoch, seconds):
+    # Start of the bucket holding epoch; -infinity stays as it is
+    if math.isinf(epoch):
+        return epoch
+    return epoch // seconds * seconds
+
+
+def backfill(conn, since):
+    with conn.cursor() as cur:
+        # Block inserts so the trigger can't race the recompute
+        cur.execute("LOCK TABLE iso.dht IN SHARE MODE")
+        # Postgres parses `since`, so any timestamptz literal works
+        cur.execute("SELECT extract(epoch FROM %s::timestamptz)::float8", (since,))
+        epoch = cur.fetchone()[0]
+        for seconds, table in ROLLUPS:
+            start = bucket_floor(epoch, seconds)
+            print(f"backfilling {table} since {since} (from {start})")
+            cur.execute(
+                ROLLUP_BACKFILL_SQL.format(table=table, seconds=seconds), (start,)
+            )
+            print(f"  {cur.rowcount} buckets")
+    conn.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage iso.dht rollup tables")
+    parser.add_argument("command", choices=["install", "backfill"])
+    parser.add_argument("--dsn", default=os.environ.get("PSQL_DSN"))
+    parser.add_argument(
+        "--since", default="-infinity", help="only backfill rows at or after this ts"
+    )
+    args = parser.parse_args(argv)
+    if not args.dsn:
+        parser.error("--dsn or PSQL_DSN is required")
+
+    import psycopg
+
+    with psycopg.connect(args.dsn) as conn:
+        if args.command == "install":
+            install(conn)
+            print("rollup tables and trigger installed")
+        else:
+            install(conn)
+            backfill(conn, args.since)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+../common/dhtStorage.py
\ No newline at end of file
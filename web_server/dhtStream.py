@@ -0,0 +1,54 @@
+import asyncio
+from collections import deque
+
+
+class Broadcast:
+    # Single ring of pre-encoded SSE frames shared by every /stream client.
+    #
+    # Each client only remembers the sequence number of the last frame it
+    # sent. A client that falls more than `max_lag` frames behind (a slow
+    # consumer whose sends are stalling) skips straight to the newest frame
+    # instead of replaying stale readings.
+    def __init__(self, size=64, max_lag=8, keepalive=15):
+        self.frames = deque(maxlen=size)
+        self.seq = 0
+        self.max_lag = max_lag
+        self.keepalive = keepalive
+        self.loop = None
+        self.changed = asyncio.Event()
+        self.clients = 0
+
+    def start(self, loop):
+        self.loop = loop
+
+    def publish(self, data):
+        # Safe to call from any thread; `data` is the JSON payload bytes
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self._publish, data)
+
+    def _publish(self, data):
+        self.seq += 1
+        self.frames.append((self.seq, b"id: %d\ndata: %s\n\n" % (self.seq, data)))
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def stream(self):
+        self.clients += 1
+        try:
+            seq = self.seq
+            while True:
+                if seq == self.seq:
+                    try:
+                        await asyncio.wait_for(self.changed.wait(), self.keepalive)
+                    except asyncio.TimeoutError:
+                        yield b": keepalive\n\n"
+                        continue
+                if self.seq - seq > self.max_lag:
+                    seq = self.seq - 1
+                for frame_seq, frame in list(self.frames):
+                    if frame_seq > seq:
+                        yield frame
+                        seq = frame_seq
+        finally:
+            self.clients -= 1
@@ -0,0 +1,4 @@
+#!/bin/bash
+# Single MQTT subscriber shared by the server_workers.sh workers
+cd /home/andre/dhtHost/web_server
+/usr/bin/python /home/andre/dhtHost/web_server/dhtIngest.py
@@ -0,0 +1,7 @@
+#!/bin/bash
+# Multi-process mode: the workers read readings and live state from the
+# dhtIngest.py relay (dht_ingest.service) instead of each subscribing to MQTT.
+# They do not push dht_bucket_update to the LCD; run server.sh for that.
+cd /home/andre/dhtHost/web_server
+export DHT_INGEST=socket
+/usr/bin/uvicorn --port 8071 --host 0.0.0.0 --workers ${WEB_WORKERS:-$(nproc)} dhtServer:app